@@ -1,52 +1,102 @@
+from api import search
 from api.models import (Favorite, Ingredient, IngredientAmount, Recipe,
-                        ShopingCart, Tag)
+                        ShopingCart, ShoppingListItem, Tag)
+from api.pagination import EstimatedCountPaginator
 from django.contrib import admin
+from django.contrib.admin.utils import get_fields_from_path
+from django.core.exceptions import ValidationError
+from django.db.models import Q
+
+
+class ScalableAdmin(admin.ModelAdmin):
+    paginator = EstimatedCountPaginator
+    show_full_result_count = False
+
+    def get_search_results(self, request, queryset, search_term):
+        fields = self.get_search_fields(request)
+        term = search_term.strip()
+        if not term or not fields or not all(
+                field.startswith("=") for field in fields):
+            return super().get_search_results(request, queryset, search_term)
+        condition = Q()
+        for lookup in (field[1:] for field in fields):
+            field = get_fields_from_path(self.model, lookup)[-1]
+            try:
+                value = field.to_python(term)
+            except ValidationError:
+                continue
+            condition |= Q(**{lookup: value})
+        if not condition:
+            return queryset.none(), False
+        return queryset.filter(condition), False
 
 
 @admin.register(Tag)
-class TagAdmin(admin.ModelAdmin):
+class TagAdmin(ScalableAdmin):
     list_display = ("name", "color", "slug")
     search_fields = ("name", "slug")
-    list_filter = ("id", "name", "slug")
     empty_value_display = "-NONE-"
 
 
 @admin.register(Ingredient)
-class IngredientAdmin(admin.ModelAdmin):
+class IngredientAdmin(ScalableAdmin):
     list_display = ("name", "measurement_unit")
-    search_fields = ("name",)
-    list_filter = ("name",)
+    search_fields = ("^name",)
     empty_value_display = "-NONE-"
 
 
 @admin.register(Recipe)
-class RecipeAdmin(admin.ModelAdmin):
-    list_display = ("id", "name", "author")
-    list_filter = ("name", "author")
+class RecipeAdmin(ScalableAdmin):
+    list_display = (
+        "id", "name", "author", "favorites_count", "in_carts_count")
+    list_filter = ("tags",)
+    list_select_related = ("author",)
+    search_fields = ("name",)
+    raw_id_fields = ("author",)
+    autocomplete_fields = ("tags", "ingredients")
+    readonly_fields = ("favorites_count", "in_carts_count")
     empty_value_display = "-NONE-"
 
-    def count_favorite(self, obj):
-        user = self.context["request"].user
-        return Favorite.objects.filter(user=user, recipe=obj).count()
+    def get_search_results(self, request, queryset, search_term):
+        term = search_term.strip()
+        if not term or not search.supported():
+            return super().get_search_results(request, queryset, search_term)
+        return search.search(queryset, term), False
 
 
 @admin.register(Favorite)
-class FavoriteAdmin(admin.ModelAdmin):
+class FavoriteAdmin(ScalableAdmin):
     list_display = ("id", "user", "recipe")
-    list_filter = ("user",)
+    list_select_related = ("user", "recipe")
+    search_fields = ("=user__username",)
+    raw_id_fields = ("user", "recipe")
     empty_value_display = "-NONE-"
 
 
 @admin.register(ShopingCart)
-class ShopingCartAdmin(admin.ModelAdmin):
+class ShopingCartAdmin(ScalableAdmin):
     list_display = ("id", "user", "recipe")
-    list_filter = ("user",)
+    list_select_related = ("user", "recipe")
+    search_fields = ("=user__username",)
+    raw_id_fields = ("user", "recipe")
     empty_value_display = "-NONE-"
 
 
 @admin.register(IngredientAmount)
-class IngredientAmount(admin.ModelAdmin):
-    list_display = ("id", "ingredient", "recipe")
-    search_fields = ("id", "ingredient", "recipe")
-    list_filter = ("id", "ingredient", "recipe")
+class IngredientAmountAdmin(ScalableAdmin):
+    list_display = ("id", "ingredient", "recipe", "amount")
+    list_select_related = ("ingredient", "recipe")
+    search_fields = ("=recipe__id",)
+    raw_id_fields = ("recipe",)
+    autocomplete_fields = ("ingredient",)
+    empty_value_display = "-NONE-"
+
+
+@admin.register(ShoppingListItem)
+class ShoppingListItemAdmin(ScalableAdmin):
+    list_display = ("id", "user", "ingredient", "total_amount")
+    list_select_related = ("user", "ingredient")
+    search_fields = ("=user__username",)
+    raw_id_fields = ("user",)
+    autocomplete_fields = ("ingredient",)
     empty_value_display = "-NONE-"
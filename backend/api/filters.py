@@ -1,6 +1,9 @@
-from api.models import Recipe, Tag
+from api import search
+from api.models import Favorite, Recipe, ShopingCart, Tag
 from django.contrib.auth import get_user_model
+from django.db.models import Exists, OuterRef
 from django_filters import rest_framework as filters
+from rest_framework.filters import BaseFilterBackend
 
 User = get_user_model()
 
@@ -10,6 +13,7 @@ class CustomRecipeFilter(filters.FilterSet):
         field_name="tags__slug",
         to_field_name="slug",
         queryset=Tag.objects.all(),
+        method="get_tags",
     )
     author = filters.ModelChoiceFilter(queryset=User.objects.all())
     is_favorited = filters.BooleanFilter(
@@ -30,12 +34,46 @@ class CustomRecipeFilter(filters.FilterSet):
             'is_in_shopping_cart',
         )
 
+    def get_tags(self, queryset, name, tags):
+        if not tags:
+            return queryset
+        return queryset.filter(Exists(Recipe.tags.through.objects.filter(
+            recipe=OuterRef("pk"), tag__in=tags)))
+
     def get_favorite(self, queryset, name, item_value):
         if self.request.user.is_authenticated and item_value:
-            queryset = queryset.filter(recipe_favorite__user=self.request.user)
+            queryset = queryset.filter(Exists(Favorite.objects.filter(
+                user=self.request.user, recipe=OuterRef("pk"))))
         return queryset
 
     def get_shopping(self, queryset, name, item_value):
         if self.request.user.is_authenticated and item_value:
-            queryset = queryset.filter(recipe_cart__user=self.request.user)
+            queryset = queryset.filter(Exists(ShopingCart.objects.filter(
+                user=self.request.user, recipe=OuterRef("pk"))))
         return queryset
+
+
+class RecipeSearchFilter(BaseFilterBackend):
+    search_param = "search"
+
+    def filter_queryset(self, request, queryset, view):
+        terms = request.query_params.get(self.search_param, "").strip()
+        if not terms:
+            return queryset
+        return search.search(queryset, terms)
+
+
+class RecipeOrderingFilter(BaseFilterBackend):
+    ordering_param = "ordering"
+    orderings = {
+        "-id": ("-id",),
+        "cooking_time": ("cooking_time", "id"),
+        "-cooking_time": ("-cooking_time", "-id"),
+        "-favorites_count": ("-favorites_count", "-id"),
+    }
+
+    def filter_queryset(self, request, queryset, view):
+        ordering = request.query_params.get(self.ordering_param)
+        if ordering not in self.orderings:
+            return queryset
+        return queryset.order_by(*self.orderings[ordering])
@@ -0,0 +1,127 @@
+import hashlib
+import io
+import logging
+from concurrent.futures import ThreadPoolExecutor
+from concurrent.futures import wait as wait_futures
+
+from api.storage import content_storage
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.db import connection
+from PIL import Image, ImageOps, features
+
+logger = logging.getLogger(__name__)
+
+SIZES = {
+    "thumbnail": 160,
+    "card": 480,
+    "full": 1280,
+}
+
+executor = None
+pending = set()
+
+
+def output_format():
+    if features.check("webp"):
+        return "WEBP", "webp", {"quality": 80, "method": 4}
+    return "JPEG", "jpg", {
+        "quality": 82, "optimize": True, "progressive": True}
+
+
+def render(source, size, image_format, options):
+    image = source.copy()
+    image.thumbnail((size, size), Image.LANCZOS)
+    if image_format == "JPEG" and image.mode != "RGB":
+        background = Image.new("RGB", image.size, "white")
+        image = image.convert("RGBA")
+        background.paste(image, mask=image.getchannel("A"))
+        image = background
+    elif image.mode not in ("RGB", "RGBA"):
+        image = image.convert("RGBA")
+    buffer = io.BytesIO()
+    image.save(buffer, image_format, **options)
+    return buffer.getvalue()
+
+
+def is_ready(recipe):
+    derivatives = recipe.image_derivatives or {}
+    return bool(recipe.image) and (
+        derivatives.get("source") == recipe.image.name)
+
+
+def generate(recipe_id):
+    from api.models import DataVersion, Recipe
+
+    recipe = Recipe.objects.filter(id=recipe_id).only(
+        "id", "image", "image_derivatives").first()
+    if recipe is None or not recipe.image or is_ready(recipe):
+        return
+    source_name = recipe.image.name
+    with recipe.image.open("rb") as f:
+        source = ImageOps.exif_transpose(Image.open(f))
+        source.load()
+    image_format, extension, options = output_format()
+    prefix = hashlib.sha1(source_name.encode()).hexdigest()[:12]
+    derivatives = {"source": source_name}
+    for name, size in SIZES.items():
+        path = f"media/derivatives/{recipe.id}/{prefix}-{name}.{extension}"
+        if default_storage.exists(path):
+            default_storage.delete(path)
+        derivatives[name] = default_storage.save(
+            path, ContentFile(render(source, size, image_format, options)))
+    if Recipe.objects.filter(id=recipe.id, image=source_name).update(
+            image_derivatives=derivatives):
+        DataVersion.objects.bump_on_commit(Recipe)
+
+
+def run(recipe_id):
+    try:
+        generate(recipe_id)
+    except Exception:
+        logger.exception("image derivatives failed for recipe %s", recipe_id)
+    finally:
+        connection.close()
+
+
+def schedule(recipe_id):
+    global executor
+    workers = settings.IMAGE_DERIVATIVE_WORKERS
+    if not workers:
+        try:
+            generate(recipe_id)
+        except Exception:
+            logger.exception(
+                "image derivatives failed for recipe %s", recipe_id)
+        return
+    if executor is None:
+        executor = ThreadPoolExecutor(
+            max_workers=workers, thread_name_prefix="image-derivatives")
+    future = executor.submit(run, recipe_id)
+    pending.add(future)
+    future.add_done_callback(pending.discard)
+
+
+def wait():
+    wait_futures(list(pending))
+
+
+def image_urls(name, derivatives, request=None):
+    if not name:
+        return dict.fromkeys(SIZES)
+    if not derivatives or derivatives.get("source") != name:
+        derivatives = {}
+    urls = {}
+    for size in SIZES:
+        if size in derivatives:
+            url = default_storage.url(derivatives[size])
+        else:
+            url = content_storage.url(name)
+        urls[size] = request.build_absolute_uri(url) if request else url
+    return urls
+
+
+def derivative_urls(recipe, request=None):
+    return image_urls(
+        recipe.image.name, recipe.image_derivatives, request)
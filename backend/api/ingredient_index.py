@@ -0,0 +1,159 @@
+import bisect
+import mmap
+import os
+import struct
+import tempfile
+import threading
+
+from django.conf import settings
+
+MAGIC = b"FGIX"
+VERSION = 2
+HEADER = struct.Struct("<4sIQIIII")
+ID = struct.Struct("<q")
+OFFSET = struct.Struct("<I")
+
+
+class Keys:
+    def __init__(self, index):
+        self.index = index
+
+    def __len__(self):
+        return self.index.count
+
+    def __getitem__(self, position):
+        return self.index.string(
+            self.index.key_offsets, self.index.keys_start, position)
+
+
+class IngredientIndex:
+    def __init__(self, path=None):
+        self.path = path
+        self.stamp = None
+        self.map = None
+        self.lock = threading.Lock()
+
+    def open(self):
+        path = self.path or settings.INGREDIENT_INDEX_PATH
+        try:
+            stat = os.stat(path)
+        except FileNotFoundError:
+            self.close()
+            return False
+        stamp = (stat.st_ino, stat.st_mtime_ns, stat.st_size)
+        if stamp == self.stamp:
+            return self.map is not None
+        self.close()
+        self.stamp = stamp
+        try:
+            with open(path, "rb") as f:
+                data = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        except (OSError, ValueError):
+            return False
+        try:
+            (magic, version, data_version, count, keys, names,
+             units) = HEADER.unpack_from(data)
+        except struct.error:
+            magic = version = None
+        if magic != MAGIC or version != VERSION:
+            data.close()
+            return False
+        self.map = data
+        self.data_version = data_version
+        self.count = count
+        self.ids_start = HEADER.size
+        self.key_offsets = self.ids_start + ID.size * count
+        self.name_offsets = self.key_offsets + OFFSET.size * (count + 1)
+        self.unit_offsets = self.name_offsets + OFFSET.size * (count + 1)
+        self.keys_start, self.names_start, self.units_start = (
+            keys, names, units)
+        return True
+
+    def close(self):
+        if self.map is not None:
+            self.map.close()
+        self.map = None
+        self.stamp = None
+
+    def string(self, offsets, start, position):
+        begin, end = struct.unpack_from(
+            "<II", self.map, offsets + OFFSET.size * position)
+        return self.map[start + begin:start + end].decode("utf-8")
+
+    def search(self, prefix, data_version):
+        with self.lock:
+            if not self.open() or self.data_version != data_version:
+                return None
+            return self.find(prefix)
+
+    def find(self, prefix):
+        prefix = prefix.casefold()
+        keys = Keys(self)
+        position = bisect.bisect_left(keys, prefix)
+        found = []
+        while position < self.count and keys[position].startswith(prefix):
+            found.append(position)
+            position += 1
+        ingredients = []
+        for position in found:
+            ingredient_id, = ID.unpack_from(
+                self.map, self.ids_start + ID.size * position)
+            ingredients.append({
+                "id": ingredient_id,
+                "name": self.string(
+                    self.name_offsets, self.names_start, position),
+                "measurement_unit": self.string(
+                    self.unit_offsets, self.units_start, position),
+            })
+        ingredients.sort(key=lambda ingredient: ingredient["id"])
+        return ingredients
+
+
+def pack(strings):
+    offsets = [0]
+    blob = bytearray()
+    for value in strings:
+        blob += value.encode("utf-8")
+        offsets.append(len(blob))
+    return b"".join(OFFSET.pack(offset) for offset in offsets), bytes(blob)
+
+
+def build(path=None):
+    from api.models import DataVersion, Ingredient
+
+    path = path or settings.INGREDIENT_INDEX_PATH
+    data_version, = DataVersion.objects.versions(Ingredient)
+    rows = sorted(
+        (name.casefold(), ingredient_id, name, unit)
+        for ingredient_id, name, unit in Ingredient.objects.values_list(
+            "id", "name", "measurement_unit").iterator()
+    )
+    ids = b"".join(ID.pack(row[1]) for row in rows)
+    key_offsets, keys = pack(row[0] for row in rows)
+    name_offsets, names = pack(row[2] for row in rows)
+    unit_offsets, units = pack(row[3] for row in rows)
+    keys_start = (
+        HEADER.size + len(ids) + len(key_offsets) + len(name_offsets)
+        + len(unit_offsets)
+    )
+    header = HEADER.pack(
+        MAGIC, VERSION, data_version, len(rows), keys_start,
+        keys_start + len(keys), keys_start + len(keys) + len(names),
+    )
+    directory = os.path.dirname(path)
+    os.makedirs(directory, exist_ok=True)
+    fd, tmp_path = tempfile.mkstemp(dir=directory, suffix=".tmp")
+    try:
+        with os.fdopen(fd, "wb") as f:
+            os.fchmod(f.fileno(), 0o644)
+            for chunk in (header, ids, key_offsets, name_offsets,
+                          unit_offsets, keys, names, units):
+                f.write(chunk)
+        os.replace(tmp_path, path)
+    except BaseException:
+        os.unlink(tmp_path)
+        raise
+    return len(rows)
+
+
+index = IngredientIndex()
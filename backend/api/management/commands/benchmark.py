@@ -0,0 +1,505 @@
+import io
+import json
+import math
+import os
+import random
+import tempfile
+import time
+from collections import namedtuple
+
+from api import images, projections
+from api.models import (Favorite, Ingredient, IngredientAmount, Recipe,
+                        ShopingCart, Tag)
+from api.pagination import encode_cursor
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.contrib.auth.hashers import make_password
+from django.core.management import call_command
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.test.utils import override_settings
+from rest_framework.authtoken.models import Token
+from rest_framework.test import APIClient
+from users.models import Follow
+
+User = get_user_model()
+
+DEFAULT_BASELINE = os.path.join(
+    settings.BASE_DIR, "data", "benchmark_baseline.json")
+PASSWORD = "benchmark-password"
+SPARE_TOKEN = "b" * 40
+IMAGE = (
+    "data:image/png;base64,iVBORw0KGgoAAAANSUhEUgAAAAEAAAABCAYAAAAfFcSJAAAA"
+    "DUlEQVR42mP8z8BQDwAEhQGAhKmMIQAAAABJRU5ErkJggg=="
+)
+
+Endpoint = namedtuple(
+    "Endpoint",
+    ("name", "method", "path", "data", "client", "before", "after"),
+)
+
+
+def endpoint(name, method, path, data=None, client=None, before=None,
+             after=None):
+    return Endpoint(name, method, path, data, client, before, after)
+
+
+def send(method, path, data):
+    def callback(client, response):
+        getattr(client, method)(path, data, format="json")
+    return callback
+
+
+class QueryTimer:
+    def __init__(self):
+        self.timings = []
+
+    def __call__(self, execute, sql, params, many, context):
+        started = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.timings.append(time.perf_counter() - started)
+
+
+def percentile(values, pct):
+    ordered = sorted(values)
+    index = max(math.ceil(pct / 100 * len(ordered)) - 1, 0)
+    return ordered[index]
+
+
+class Command(BaseCommand):
+    help = (
+        "seed a throwaway database and measure queries, SQL time, latency "
+        "and response size of every API endpoint against a baseline"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--users", type=int, default=50)
+        parser.add_argument("--recipes", type=int, default=300)
+        parser.add_argument("--tags", type=int, default=10)
+        parser.add_argument("--ingredients", type=int, default=500)
+        parser.add_argument("--ingredients-per-recipe", type=int, default=8)
+        parser.add_argument("--tags-per-recipe", type=int, default=2)
+        parser.add_argument("--favorites", type=int, default=20,
+                            help="favorite recipes per user")
+        parser.add_argument("--cart", type=int, default=10,
+                            help="shopping cart recipes per user")
+        parser.add_argument("--follows", type=int, default=10,
+                            help="followed authors per user")
+        parser.add_argument("--repeat", type=int, default=10,
+                            help="measured requests per endpoint")
+        parser.add_argument("--seed", type=int, default=0)
+        parser.add_argument("--baseline", default=DEFAULT_BASELINE)
+        parser.add_argument("--save-baseline", action="store_true",
+                            help="write the results as the new baseline")
+        parser.add_argument("--tolerance", type=float, default=25.0,
+                            help="allowed p50 latency growth in percent")
+        parser.add_argument("--latency-floor", type=float, default=1.0,
+                            help="ignore latency growth below this many ms")
+        parser.add_argument("--only", default="",
+                            help="run endpoints whose name contains this")
+        parser.add_argument("--output", help="write the results to a file")
+        parser.add_argument("--keepdb", action="store_true",
+                            help="keep the benchmark database between runs")
+
+    def handle(self, *args, **options):
+        old_name = connection.settings_dict["NAME"]
+        connection.creation.create_test_db(
+            verbosity=0, autoclobber=True, keepdb=options["keepdb"])
+        media_root = tempfile.mkdtemp(prefix="foodgram-benchmark-")
+        try:
+            with override_settings(
+                ALLOWED_HOSTS=["*"],
+                DEBUG=False,
+                MEDIA_ROOT=media_root,
+                INGREDIENT_INDEX_PATH=os.path.join(
+                    media_root, "ingredients.idx"),
+                EMAIL_BACKEND="django.core.mail.backends.locmem.EmailBackend",
+                CACHES={"default": {
+                    "BACKEND": "django.core.cache.backends.locmem.LocMemCache",
+                    "LOCATION": "benchmark",
+                }},
+            ):
+                context = self.seed(options)
+                results = self.run(context, options)
+        finally:
+            images.wait()
+            connection.creation.destroy_test_db(
+                old_name, verbosity=0, keepdb=options["keepdb"])
+        self.report(results)
+        if options["output"]:
+            self.write_json(options["output"], results)
+        if options["save_baseline"]:
+            self.write_json(options["baseline"], results)
+            self.stdout.write(f"baseline saved to {options['baseline']}")
+            return
+        self.check_baseline(results, options)
+
+    def seed(self, options):
+        rnd = random.Random(options["seed"])
+        Follow.objects.all().delete()
+        Recipe.objects.all().delete()
+        Ingredient.objects.all().delete()
+        Tag.objects.all().delete()
+        User.objects.all().delete()
+        password = make_password(PASSWORD)
+        User.objects.bulk_create(
+            User(
+                username=f"user{i}",
+                email=f"user{i}@foodgram.test",
+                first_name=f"First{i}",
+                last_name=f"Last{i}",
+                password=password,
+            )
+            for i in range(max(options["users"], 2) + 1)
+        )
+        users = list(User.objects.order_by("id"))
+        spare = users.pop()
+        Tag.objects.bulk_create(
+            Tag(name=f"Tag {i}", color=f"#{i:06X}", slug=f"tag-{i}")
+            for i in range(max(options["tags"], 1))
+        )
+        tags = list(Tag.objects.order_by("id"))
+        Ingredient.objects.bulk_create(
+            Ingredient(name=f"ingredient {i}", measurement_unit="г")
+            for i in range(max(options["ingredients"], 1))
+        )
+        ingredients = list(Ingredient.objects.order_by("id"))
+        Recipe.objects.bulk_create(
+            Recipe(
+                author=rnd.choice(users),
+                name=f"Recipe {i}",
+                image="media/benchmark.png",
+                text="Benchmark recipe text. " * 20,
+                cooking_time=rnd.randint(1, 120),
+            )
+            for i in range(max(options["recipes"], 1))
+        )
+        recipes = list(Recipe.objects.order_by("id"))
+        Recipe.tags.through.objects.bulk_create(
+            Recipe.tags.through(recipe=recipe, tag=tag)
+            for recipe in recipes
+            for tag in rnd.sample(
+                tags, min(options["tags_per_recipe"], len(tags)))
+        )
+        IngredientAmount.objects.bulk_create(
+            IngredientAmount(
+                recipe=recipe, ingredient=ingredient,
+                amount=rnd.randint(1, 500))
+            for recipe in recipes
+            for ingredient in rnd.sample(
+                ingredients,
+                min(options["ingredients_per_recipe"], len(ingredients)),
+            )
+        )
+        for model, count in (
+            (Favorite, options["favorites"]),
+            (ShopingCart, options["cart"]),
+        ):
+            model.objects.bulk_create(
+                model(user=user, recipe=recipe)
+                for user in users
+                for recipe in rnd.sample(recipes, min(count, len(recipes)))
+            )
+        call_command("shopping_list", stdout=io.StringIO())
+        call_command("recipe_counters", stdout=io.StringIO())
+        call_command("ingredient_index", stdout=io.StringIO())
+        call_command("search_index", stdout=io.StringIO())
+        follows = min(options["follows"], len(users) - 2)
+        Follow.objects.bulk_create(
+            Follow(user=user, following=author)
+            for user in users
+            for author in rnd.sample(
+                [other for other in users if other != user], follows)
+        )
+        call_command("timelines", stdout=io.StringIO())
+        user = users[0]
+        followed = set(
+            Follow.objects.filter(user=user).values_list(
+                "following_id", flat=True))
+        return {
+            "user": user,
+            "spare": spare,
+            "recipe": recipes[0],
+            "own_recipe": Recipe.objects.filter(author=user).first()
+            or recipes[0],
+            "free_recipe": Recipe.objects.exclude(recipe_favorite__user=user)
+            .exclude(recipe_cart__user=user).first(),
+            "author": next(
+                other for other in users
+                if other != user and other.id not in followed),
+            "tag": tags[0],
+            "ingredient": ingredients[0],
+            "ingredients": ingredients,
+        }
+
+    def endpoints(self, context):
+        user = context["user"]
+        spare = context["spare"]
+        recipe = context["recipe"].id
+        own = context["own_recipe"].id
+        free = context["free_recipe"].id
+        author = context["author"].id
+        tag = context["tag"]
+        ingredient = context["ingredient"]
+        deep = Recipe.objects.order_by("id").values_list("id", flat=True)[6]
+        deep_cursor = encode_cursor("-id", [deep])
+        recipe_data = {
+            "name": "Benchmark recipe",
+            "text": "Benchmark recipe text.",
+            "cooking_time": 10,
+            "image": IMAGE,
+            "tags": [tag.id],
+            "ingredients": [
+                {"id": item.id, "amount": 10}
+                for item in context["ingredients"][:10]
+            ],
+        }
+
+        def wait_for_images(client, response):
+            images.wait()
+
+        def delete_created(client, response):
+            images.wait()
+            if response.status_code == 201:
+                Recipe.objects.filter(id=response.data["id"]).delete()
+
+        def delete_user(client, response):
+            User.objects.filter(username="benchmark-new").delete()
+
+        def toggle(model, field, value, present):
+            def callback(client, response):
+                lookup = {"user": user, field: value}
+                if present:
+                    model.objects.get_or_create(**lookup)
+                else:
+                    model.objects.filter(**lookup).delete()
+            return callback
+
+        many = {"recipes": list(
+            Recipe.objects.order_by("id").values_list("id", flat=True)[:100])}
+        cart = "/api/recipes/shopping_cart/"
+        favorites = "/api/recipes/favorite/"
+
+        def restore_spare_token(client, response):
+            Token.objects.get_or_create(key=SPARE_TOKEN, user=spare)
+
+        return [
+            endpoint("tags-list", "get", "/api/tags/"),
+            endpoint("tags-detail", "get", f"/api/tags/{tag.id}/"),
+            endpoint("ingredients-list", "get", "/api/ingredients/"),
+            endpoint("ingredients-search", "get",
+                     f"/api/ingredients/?name={ingredient.name[:5]}"),
+            endpoint("ingredients-detail", "get",
+                     f"/api/ingredients/{ingredient.id}/"),
+            endpoint("recipes-list", "get", "/api/recipes/"),
+            endpoint("recipes-list-limit", "get", "/api/recipes/?limit=50"),
+            endpoint("recipes-list-full", "get",
+                     "/api/recipes/?limit=50&fields=" + ",".join(
+                         projections.RECIPE_FIELDS)),
+            endpoint("recipes-list-sparse", "get",
+                     "/api/recipes/?limit=50&fields=id,name,image"),
+            endpoint("recipes-list-deep", "get",
+                     "/api/recipes/?page=10&limit=6"),
+            endpoint("recipes-cursor", "get", "/api/recipes/?cursor=&limit=6"),
+            endpoint("recipes-cursor-deep", "get",
+                     f"/api/recipes/?cursor={deep_cursor}&limit=6"),
+            endpoint("recipes-cursor-cooking-time", "get",
+                     "/api/recipes/?cursor=&ordering=cooking_time&limit=6"),
+            endpoint("recipes-search", "get",
+                     "/api/recipes/?search=recipe%2042"),
+            endpoint("recipes-search-ingredient", "get",
+                     f"/api/recipes/?search={ingredient.name}"
+                     f"&tags={tag.slug}"),
+            endpoint("recipes-feed", "get", "/api/recipes/feed/"),
+            endpoint("recipes-feed-deep", "get",
+                     f"/api/recipes/feed/?cursor={deep_cursor}&limit=6"),
+            endpoint("recipes-list-popular", "get",
+                     "/api/recipes/?ordering=-favorites_count"),
+            endpoint("recipes-cursor-popular", "get",
+                     "/api/recipes/?cursor=&ordering=-favorites_count"
+                     "&limit=6"),
+            endpoint("recipes-list-tags", "get",
+                     f"/api/recipes/?tags={tag.slug}"),
+            endpoint("recipes-list-author", "get",
+                     f"/api/recipes/?author={author}"),
+            endpoint("recipes-list-favorited", "get",
+                     "/api/recipes/?is_favorited=1"),
+            endpoint("recipes-list-in-cart", "get",
+                     "/api/recipes/?is_in_shopping_cart=1"),
+            endpoint("recipes-detail", "get", f"/api/recipes/{recipe}/"),
+            endpoint("recipes-create", "post", "/api/recipes/",
+                     data=recipe_data, after=delete_created),
+            endpoint("recipes-update", "patch", f"/api/recipes/{own}/",
+                     data=recipe_data, after=wait_for_images),
+            endpoint("recipes-download-cart", "get",
+                     "/api/recipes/download_shopping_cart/"),
+            endpoint("recipes-shopping-list", "get",
+                     "/api/recipes/shopping_list/"),
+            endpoint("favorite-add", "post",
+                     f"/api/recipes/{free}/favorite/",
+                     after=toggle(Favorite, "recipe_id", free, False)),
+            endpoint("favorite-remove", "delete",
+                     f"/api/recipes/{free}/favorite/",
+                     before=toggle(Favorite, "recipe_id", free, True)),
+            endpoint("cart-add", "post",
+                     f"/api/recipes/{free}/shopping_cart/",
+                     after=toggle(ShopingCart, "recipe_id", free, False)),
+            endpoint("cart-remove", "delete",
+                     f"/api/recipes/{free}/shopping_cart/",
+                     before=toggle(ShopingCart, "recipe_id", free, True)),
+            endpoint("cart-add-many", "post", cart, data=many,
+                     after=send("delete", cart, many)),
+            endpoint("cart-remove-many", "delete", cart, data=many,
+                     before=send("post", cart, many)),
+            endpoint("favorite-add-many", "post", favorites, data=many,
+                     after=send("delete", favorites, many)),
+            endpoint("favorite-remove-many", "delete", favorites, data=many,
+                     before=send("post", favorites, many)),
+            endpoint("subscriptions", "get", "/api/users/subscriptions/"),
+            endpoint("subscriptions-sparse", "get",
+                     "/api/users/subscriptions/?omit=recipes,recipes_count"),
+            endpoint("subscribe", "post", f"/api/users/{author}/subscribe/",
+                     after=toggle(Follow, "following_id", author, False)),
+            endpoint("unsubscribe", "delete",
+                     f"/api/users/{author}/subscribe/",
+                     before=toggle(Follow, "following_id", author, True)),
+            endpoint("users-list", "get", "/api/users/"),
+            endpoint("users-detail", "get", f"/api/users/{author}/"),
+            endpoint("users-me", "get", "/api/users/me/"),
+            endpoint("users-create", "post", "/api/users/", data={
+                "email": "benchmark-new@foodgram.test",
+                "username": "benchmark-new",
+                "first_name": "Benchmark",
+                "last_name": "User",
+                "password": PASSWORD,
+            }, after=delete_user),
+            endpoint("users-set-password", "post",
+                     "/api/users/set_password/", data={
+                         "new_password": PASSWORD,
+                         "current_password": PASSWORD,
+                     }),
+            endpoint("users-reset-password", "post",
+                     "/api/users/reset_password/",
+                     data={"email": user.email}),
+            endpoint("token-login", "post", "/api/auth/token/login/",
+                     data={"email": user.email, "password": PASSWORD}),
+            endpoint("token-logout", "post", "/api/auth/token/logout/",
+                     client="spare", before=restore_spare_token),
+        ]
+
+    def clients(self, context):
+        token, _ = Token.objects.get_or_create(user=context["user"])
+        clients = {
+            "anon": APIClient(raise_request_exception=False),
+            "auth": APIClient(raise_request_exception=False),
+            "spare": APIClient(raise_request_exception=False),
+        }
+        clients["auth"].credentials(HTTP_AUTHORIZATION=f"Token {token.key}")
+        clients["spare"].credentials(
+            HTTP_AUTHORIZATION=f"Token {SPARE_TOKEN}")
+        return clients
+
+    def run(self, context, options):
+        clients = self.clients(context)
+        results = {}
+        for spec in self.endpoints(context):
+            if options["only"] not in spec.name:
+                continue
+            kinds = (spec.client,) if spec.client else ("anon", "auth")
+            for kind in kinds:
+                key = f"{spec.name}:{kind}"
+                results[key] = self.measure(
+                    clients[kind], spec, options["repeat"])
+        return results
+
+    def measure(self, client, spec, repeat):
+        request = getattr(client, spec.method)
+        latencies = []
+        sql_times = []
+        queries = 0
+        size = 0
+        status = None
+        for attempt in range(max(repeat, 1) + 1):
+            if spec.before:
+                spec.before(client, None)
+            timer = QueryTimer()
+            with connection.execute_wrapper(timer):
+                started = time.perf_counter()
+                response = request(spec.path, spec.data, format="json")
+                if response.streaming:
+                    content = b"".join(response.streaming_content)
+                else:
+                    content = response.content
+                elapsed = time.perf_counter() - started
+            if spec.after:
+                spec.after(client, response)
+            if not attempt:
+                continue
+            latencies.append(elapsed * 1000)
+            sql_times.append(sum(timer.timings) * 1000)
+            queries = max(queries, len(timer.timings))
+            size = len(content)
+            status = response.status_code
+        return {
+            "status": status,
+            "queries": queries,
+            "sql_ms": round(sum(sql_times) / len(sql_times), 3),
+            "p50_ms": round(percentile(latencies, 50), 3),
+            "p95_ms": round(percentile(latencies, 95), 3),
+            "p99_ms": round(percentile(latencies, 99), 3),
+            "bytes": size,
+        }
+
+    def report(self, results):
+        header = (
+            f"{'endpoint':<32}{'status':>7}{'queries':>8}{'sql ms':>9}"
+            f"{'p50 ms':>9}{'p95 ms':>9}{'p99 ms':>9}{'bytes':>9}"
+        )
+        self.stdout.write(header)
+        for key, row in results.items():
+            self.stdout.write(
+                f"{key:<32}{row['status']:>7}{row['queries']:>8}"
+                f"{row['sql_ms']:>9.2f}{row['p50_ms']:>9.2f}"
+                f"{row['p95_ms']:>9.2f}{row['p99_ms']:>9.2f}"
+                f"{row['bytes']:>9}"
+            )
+
+    def write_json(self, path, results):
+        with open(path, "w", encoding="utf-8") as f:
+            json.dump(results, f, indent=2, sort_keys=True)
+            f.write("\n")
+
+    def check_baseline(self, results, options):
+        try:
+            with open(options["baseline"], "r", encoding="utf-8") as f:
+                baseline = json.load(f)
+        except FileNotFoundError:
+            self.stdout.write(
+                "no baseline found, run with --save-baseline to record one")
+            return
+        failures = []
+        allowed = 1 + options["tolerance"] / 100
+        for key, row in results.items():
+            expected = baseline.get(key)
+            if expected is None:
+                continue
+            if row["queries"] > expected["queries"]:
+                failures.append(
+                    f"{key}: {row['queries']} queries, "
+                    f"budget {expected['queries']}"
+                )
+            limit = max(
+                expected["p50_ms"] * allowed,
+                expected["p50_ms"] + options["latency_floor"],
+            )
+            if row["p50_ms"] > limit:
+                failures.append(
+                    f"{key}: p50 {row['p50_ms']:.2f} ms, "
+                    f"baseline {expected['p50_ms']:.2f} ms"
+                )
+        if failures:
+            raise CommandError(
+                "performance regressions:\n" + "\n".join(failures))
+        self.stdout.write(self.style.SUCCESS("within baseline budgets"))
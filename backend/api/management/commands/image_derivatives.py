@@ -0,0 +1,32 @@
+from api import images
+from api.models import Recipe
+from django.core.management.base import BaseCommand
+
+
+class Command(BaseCommand):
+    help = "create missing thumbnail, card and full size recipe images"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--all", action="store_true",
+            help="recreate the derivatives of every recipe",
+        )
+
+    def handle(self, *args, **options):
+        recipes = Recipe.objects.exclude(image="").only(
+            "id", "image", "image_derivatives").order_by("id")
+        if options["all"]:
+            recipes.update(image_derivatives={})
+        created = failed = 0
+        for recipe in recipes.iterator():
+            if images.is_ready(recipe):
+                continue
+            try:
+                images.generate(recipe.id)
+            except Exception as error:
+                failed += 1
+                self.stderr.write(f"recipe {recipe.id}: {error}")
+            else:
+                created += 1
+        self.stdout.write(
+            f"{created} recipes processed, {failed} failed")
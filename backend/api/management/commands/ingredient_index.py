@@ -0,0 +1,10 @@
+from api import ingredient_index
+from django.core.management.base import BaseCommand
+
+
+class Command(BaseCommand):
+    help = "build the memory-mapped ingredient name prefix index"
+
+    def handle(self, *args, **options):
+        count = ingredient_index.build()
+        self.stdout.write(f"{count} ingredients indexed")
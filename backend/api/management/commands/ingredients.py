@@ -1,40 +1,96 @@
+import csv
 import json
 import os
+import time
 
-from api.models import Ingredient
+from api import ingredient_index
+from api.models import DataVersion, Ingredient
 from django.conf import settings
 from django.core.management.base import BaseCommand, CommandError
-from django.db.utils import IntegrityError
+from django.db import transaction
 
 DATA_ROOT = os.path.join(settings.BASE_DIR, "data")
+CHUNK_SIZE = 64 * 1024
+
+
+def read_json(f):
+    decoder = json.JSONDecoder()
+    buffer = ""
+    position = 0
+    while True:
+        while position < len(buffer) and buffer[position] in " \t\r\n,[]":
+            position += 1
+        if position < len(buffer):
+            try:
+                item, end = decoder.raw_decode(buffer, position)
+            except json.JSONDecodeError:
+                item = None
+            if item is not None:
+                yield item["name"], item["measurement_unit"]
+                position = end
+                continue
+        chunk = f.read(CHUNK_SIZE)
+        if not chunk:
+            if position < len(buffer):
+                raise CommandError("the file contains invalid json")
+            return
+        buffer = buffer[position:] + chunk
+        position = 0
+
+
+def read_csv(f):
+    for row in csv.reader(f):
+        if row:
+            yield row[0], row[1]
 
 
 class Command(BaseCommand):
-    help = "loading ingredients from data in json"
+    help = "loading ingredients from data in json or csv"
 
     def add_arguments(self, parser):
         parser.add_argument(
             "filename", default="ingredients.json", nargs="?", type=str
         )
+        parser.add_argument("--format", choices=("json", "csv"))
+        parser.add_argument("--batch-size", type=int, default=1000)
 
     def handle(self, *args, **options):
+        path = os.path.join(DATA_ROOT, options["filename"])
+        file_format = options["format"] or os.path.splitext(path)[1][1:]
+        readers = {"json": read_json, "csv": read_csv}
+        if file_format not in readers:
+            raise CommandError(f"unsupported file format {file_format}")
+        batch_size = max(options["batch_size"], 1)
+        started = time.perf_counter()
+        rows = 0
         try:
-            with open(
-                os.path.join(
-                    DATA_ROOT, options["filename"]), "r", encoding="utf-8"
-            ) as f:
-                data = json.load(f)
-                for ingredient in data:
-                    try:
-                        Ingredient.objects.create(
-                            name=ingredient["name"],
-                            measurement_unit=ingredient["measurement_unit"],
-                        )
-                    except IntegrityError:
-                        print(
-                            f'Ingredient {ingredient["name"]} '
-                            f'{ingredient["measurement_unit"]} '
-                            f"already in data base"
-                        )
+            with open(path, "r", encoding="utf-8", newline="") as f:
+                with transaction.atomic():
+                    count_before = Ingredient.objects.count()
+                    batch = []
+                    for name, measurement_unit in readers[file_format](f):
+                        batch.append(Ingredient(
+                            name=name.strip(),
+                            measurement_unit=measurement_unit.strip(),
+                        ))
+                        if len(batch) >= batch_size:
+                            rows += self.save(batch)
+                            batch = []
+                    rows += self.save(batch)
+                    created = Ingredient.objects.count() - count_before
+                    DataVersion.objects.bump_on_commit(Ingredient)
         except FileNotFoundError:
             raise CommandError("the file is missing data")
+        except (KeyError, IndexError, TypeError):
+            raise CommandError("the file contains an incomplete ingredient")
+        ingredient_index.build()
+        elapsed = time.perf_counter() - started
+        self.stdout.write(
+            f"{rows} rows read, {created} ingredients added, "
+            f"{rows - created} duplicates skipped "
+            f"in {elapsed:.2f}s ({rows / max(elapsed, 1e-9):.0f} rows/sec)"
+        )
+
+    def save(self, batch):
+        Ingredient.objects.bulk_create(batch, ignore_conflicts=True)
+        return len(batch)
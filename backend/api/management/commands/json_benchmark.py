@@ -0,0 +1,133 @@
+import io
+import os
+import statistics
+import tempfile
+import time
+
+from api import images, renderers
+from api.management.commands.benchmark import Command as BenchmarkCommand
+from api.parsers import FastJSONParser
+from django.core.management.base import CommandError
+from django.db import connection
+from django.test.utils import override_settings
+from rest_framework.parsers import JSONParser
+from rest_framework.renderers import JSONRenderer
+
+
+class Command(BenchmarkCommand):
+    help = (
+        "seed a throwaway database, collect the payloads of every API "
+        "endpoint and compare encoding and parsing time of the stdlib and "
+        "the orjson renderer and parser"
+    )
+
+    def handle(self, *args, **options):
+        if renderers.orjson is None:
+            raise CommandError("orjson is not installed")
+        old_name = connection.settings_dict["NAME"]
+        connection.creation.create_test_db(
+            verbosity=0, autoclobber=True, keepdb=options["keepdb"])
+        media_root = tempfile.mkdtemp(prefix="foodgram-json-")
+        try:
+            with override_settings(
+                ALLOWED_HOSTS=["*"],
+                MEDIA_ROOT=media_root,
+                INGREDIENT_INDEX_PATH=os.path.join(
+                    media_root, "ingredients.idx"),
+                CACHES={"default": {
+                    "BACKEND": "django.core.cache.backends.locmem.LocMemCache",
+                    "LOCATION": "json-benchmark",
+                }},
+            ):
+                context = self.seed(options)
+                payloads, bodies = self.payloads(context, options)
+        finally:
+            images.wait()
+            connection.creation.destroy_test_db(
+                old_name, verbosity=0, keepdb=options["keepdb"])
+        repeat = max(options["repeat"], 1)
+        results, failures = {}, []
+        for name, data in payloads.items():
+            results[f"render {name}"] = self.compare_render(
+                name, data, repeat, failures)
+        for name, body in bodies.items():
+            results[f"parse {name}"] = self.compare_parse(
+                name, body, repeat, failures)
+        self.report_json(results)
+        if options["output"]:
+            self.write_json(options["output"], results)
+        if failures:
+            raise CommandError("orjson output differs:\n" + "\n".join(
+                failures))
+
+    def payloads(self, context, options):
+        clients = self.clients(context)
+        payloads, bodies = {}, {}
+        for spec in self.endpoints(context):
+            if options["only"] not in spec.name:
+                continue
+            if spec.method != "get":
+                if isinstance(spec.data, dict):
+                    bodies[spec.name] = JSONRenderer().render(spec.data)
+                continue
+            for kind in (spec.client,) if spec.client else ("anon", "auth"):
+                if spec.before:
+                    spec.before(clients[kind], None)
+                response = clients[kind].get(spec.path)
+                if response.status_code == 200 and not response.streaming:
+                    payloads[f"{spec.name}:{kind}"] = response.data
+        return payloads, bodies
+
+    def timed(self, function, repeat):
+        timings = []
+        for _ in range(repeat):
+            started = time.perf_counter()
+            result = function()
+            timings.append(time.perf_counter() - started)
+        return result, statistics.median(timings)
+
+    def row(self, size, stdlib_time, fast_time):
+        return {
+            "bytes": size,
+            "stdlib_ms": round(stdlib_time * 1000, 3),
+            "orjson_ms": round(fast_time * 1000, 3),
+            "stdlib_mb_s": round(size / max(stdlib_time, 1e-9) / 2 ** 20, 1),
+            "orjson_mb_s": round(size / max(fast_time, 1e-9) / 2 ** 20, 1),
+        }
+
+    def compare_render(self, name, data, repeat, failures):
+        stdlib, fast = JSONRenderer(), renderers.FastJSONRenderer()
+        expected, stdlib_time = self.timed(
+            lambda: stdlib.render(data), repeat)
+        actual, fast_time = self.timed(lambda: fast.render(data), repeat)
+        if expected != actual:
+            failures.append(f"render {name}")
+        return self.row(len(expected), stdlib_time, fast_time)
+
+    def compare_parse(self, name, body, repeat, failures):
+        stdlib, fast = JSONParser(), FastJSONParser()
+        expected, stdlib_time = self.timed(
+            lambda: stdlib.parse(io.BytesIO(body)), repeat)
+        actual, fast_time = self.timed(
+            lambda: fast.parse(io.BytesIO(body)), repeat)
+        if expected != actual:
+            failures.append(f"parse {name}")
+        return self.row(len(body), stdlib_time, fast_time)
+
+    def report_json(self, results):
+        self.stdout.write(
+            f"{'payload':<44}{'bytes':>9}{'stdlib ms':>11}{'orjson ms':>11}"
+            f"{'stdlib MB/s':>13}{'orjson MB/s':>13}{'speedup':>9}")
+        totals = {"bytes": 0, "stdlib_ms": 0, "orjson_ms": 0}
+        for name, row in results.items():
+            for key in totals:
+                totals[key] += row[key]
+            self.stdout.write(
+                f"{name:<44}{row['bytes']:>9}{row['stdlib_ms']:>11.3f}"
+                f"{row['orjson_ms']:>11.3f}{row['stdlib_mb_s']:>13.1f}"
+                f"{row['orjson_mb_s']:>13.1f}"
+                f"{row['stdlib_ms'] / max(row['orjson_ms'], 0.001):>8.1f}x")
+        self.stdout.write(
+            f"{'total':<44}{totals['bytes']:>9}{totals['stdlib_ms']:>11.3f}"
+            f"{totals['orjson_ms']:>11.3f}{'':>26}"
+            f"{totals['stdlib_ms'] / max(totals['orjson_ms'], 0.001):>8.1f}x")
@@ -0,0 +1,74 @@
+from datetime import timedelta
+from itertools import islice
+
+from api.models import MediaBlob, Recipe
+from api.storage import content_storage
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+
+def batches(iterable, size):
+    iterator = iter(iterable)
+    while True:
+        batch = list(islice(iterator, size))
+        if not batch:
+            return
+        yield batch
+
+
+class Command(BaseCommand):
+    help = "delete recipe images and derivatives that nothing references"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--dry-run", action="store_true",
+                            help="only report what would be deleted")
+        parser.add_argument("--min-age", type=int, default=3600,
+                            help="keep files modified in the last N seconds")
+        parser.add_argument("--batch-size", type=int, default=1000)
+
+    def referenced(self, names):
+        referenced = MediaBlob.objects.referenced(names)
+        referenced.update(Recipe.objects.filter(image__in=names).values_list(
+            "image", flat=True))
+        recipes = set()
+        for name in names:
+            parts = name.split("/")
+            if len(parts) > 3 and parts[1] == "derivatives" and (
+                    parts[2].isdigit()):
+                recipes.add(int(parts[2]))
+        for derivatives in Recipe.objects.filter(id__in=recipes).values_list(
+                "image_derivatives", flat=True):
+            referenced.update(derivatives.values())
+        return referenced
+
+    def handle(self, *args, **options):
+        directory = Recipe._meta.get_field("image").upload_to
+        if not content_storage.exists(directory):
+            self.stdout.write("nothing to collect")
+            return
+        cutoff = timezone.now() - timedelta(seconds=options["min_age"])
+        kept = deleted = freed = 0
+        for names in batches(
+            content_storage.walk(directory.rstrip("/")),
+            max(options["batch_size"], 1),
+        ):
+            referenced = self.referenced(names)
+            removed = []
+            for name in names:
+                if name in referenced or (
+                        content_storage.get_modified_time(name) > cutoff):
+                    kept += 1
+                    continue
+                freed += content_storage.size(name)
+                if not options["dry_run"]:
+                    content_storage.delete(name)
+                removed.append(name)
+            if removed and not options["dry_run"]:
+                MediaBlob.objects.filter(
+                    name__in=removed, references=0).delete()
+            deleted += len(removed)
+        action = "would delete" if options["dry_run"] else "deleted"
+        self.stdout.write(
+            f"{action} {deleted} files ({freed / 2 ** 20:.1f} MiB), "
+            f"kept {kept}"
+        )
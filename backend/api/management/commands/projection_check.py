@@ -0,0 +1,148 @@
+import os
+import statistics
+import tempfile
+import time
+from functools import partial
+
+from api import images, projections
+from api.management.commands.benchmark import Command as BenchmarkCommand
+from api.models import Ingredient, IngredientAmount, Recipe
+from api.serializers import IngredientSerializer, ListRecipeSerializer
+from django.contrib.auth.models import AnonymousUser
+from django.core.management.base import CommandError
+from django.db import connection
+from django.db.models import Prefetch
+from django.test.utils import override_settings
+from rest_framework.renderers import JSONRenderer
+from rest_framework.request import Request
+from rest_framework.test import APIRequestFactory
+from users.serializers import ListFollowSerializer
+from users.views import get_subscriptions, subscription_recipes, subscriptions
+
+
+class Command(BenchmarkCommand):
+    help = (
+        "seed a throwaway database, render the recipe, subscription and "
+        "ingredient responses with the model serializers and with the "
+        "projections, fail unless the JSON is byte-identical and report the "
+        "cost per item of both"
+    )
+
+    def handle(self, *args, **options):
+        old_name = connection.settings_dict["NAME"]
+        connection.creation.create_test_db(
+            verbosity=0, autoclobber=True, keepdb=options["keepdb"])
+        media_root = tempfile.mkdtemp(prefix="foodgram-projection-")
+        try:
+            with override_settings(
+                ALLOWED_HOSTS=["*"],
+                MEDIA_ROOT=media_root,
+                INGREDIENT_INDEX_PATH=os.path.join(
+                    media_root, "ingredients.idx"),
+                CACHES={"default": {
+                    "BACKEND": "django.core.cache.backends.locmem.LocMemCache",
+                    "LOCATION": "projection-check",
+                }},
+            ):
+                context = self.seed(options)
+                images.wait()
+                results, failures = {}, []
+                for name, serialized, projected in self.cases(context):
+                    if options["only"] in name:
+                        results[name] = self.compare(
+                            name, serialized, projected, options, failures)
+        finally:
+            images.wait()
+            connection.creation.destroy_test_db(
+                old_name, verbosity=0, keepdb=options["keepdb"])
+        self.report_costs(results)
+        if failures:
+            raise CommandError("projections differ:\n" + "\n".join(failures))
+        self.stdout.write(self.style.SUCCESS("projections are identical"))
+
+    def request(self, user, path, params=None):
+        request = Request(APIRequestFactory().get(path, params or {}))
+        request.user = user
+        return request
+
+    def cases(self, context):
+        cases = []
+        recipe_cases = (
+            ("anonymous", AnonymousUser(), projections.RECIPE_FIELDS),
+            ("user", context["user"], projections.RECIPE_FIELDS),
+            ("card", context["user"], projections.RECIPE_CARD_FIELDS),
+        )
+        for label, user, fields in recipe_cases:
+            request = self.request(user, "/api/recipes/")
+
+            def serialized(request=request, fields=fields):
+                recipes = Recipe.objects.select_related(
+                    "author").prefetch_related("tags", Prefetch(
+                        "recipe_shop",
+                        queryset=IngredientAmount.objects.select_related(
+                            "ingredient"),
+                    ))
+                return ListRecipeSerializer(recipes, many=True, context={
+                    "request": request, "fields": fields}).data
+
+            def projected(request=request, fields=fields):
+                return projections.recipes(list(projections.recipe_rows(
+                    Recipe.objects.all(), fields)), request, fields)
+
+            cases.append((f"recipes:{label}", serialized, projected))
+        for limit in (None, 0, 3):
+            params = {} if limit is None else {"recipes_limit": limit}
+            request = self.request(
+                context["user"], "/api/users/subscriptions/", params)
+
+            def serialized(request=request):
+                return ListFollowSerializer(
+                    get_subscriptions(request), many=True,
+                    context={"request": request}).data
+
+            def projected(request=request):
+                return projections.follows(
+                    list(projections.follow_rows(subscriptions(request))),
+                    partial(subscription_recipes, request), request)
+
+            cases.append((f"subscriptions:limit={limit}", serialized,
+                          projected))
+        cases.append((
+            "ingredients",
+            lambda: IngredientSerializer(
+                Ingredient.objects.all(), many=True).data,
+            lambda: projections.ingredients(Ingredient.objects.all()),
+        ))
+        return cases
+
+    def timed(self, build, repeat):
+        timings = []
+        for _ in range(repeat):
+            started = time.perf_counter()
+            data = build()
+            timings.append(time.perf_counter() - started)
+        return data, statistics.median(timings)
+
+    def compare(self, name, serialized, projected, options, failures):
+        repeat = max(options["repeat"], 1)
+        expected, serializer_time = self.timed(serialized, repeat)
+        actual, projection_time = self.timed(projected, repeat)
+        renderer = JSONRenderer()
+        if renderer.render(expected) != renderer.render(actual):
+            failures.append(name)
+        items = max(len(expected), 1)
+        return {
+            "items": len(expected),
+            "serializer_us": round(serializer_time / items * 1e6, 1),
+            "projection_us": round(projection_time / items * 1e6, 1),
+        }
+
+    def report_costs(self, results):
+        self.stdout.write(
+            f"{'response':<28}{'items':>7}{'serializer us':>15}"
+            f"{'projection us':>15}{'speedup':>9}")
+        for name, row in results.items():
+            speedup = row["serializer_us"] / max(row["projection_us"], 0.1)
+            self.stdout.write(
+                f"{name:<28}{row['items']:>7}{row['serializer_us']:>15.1f}"
+                f"{row['projection_us']:>15.1f}{speedup:>8.1f}x")
@@ -0,0 +1,170 @@
+import itertools
+import json
+import os
+import tempfile
+
+from api.filters import CustomRecipeFilter
+from api.management.commands.benchmark import Command as BenchmarkCommand
+from api.models import Recipe
+from django.core.management.base import CommandError
+from django.db import connection
+from django.http import QueryDict
+from django.test.utils import override_settings
+from rest_framework.test import APIRequestFactory
+
+WATCHED_TABLES = (
+    "api_recipe",
+    "api_recipe_tags",
+    "api_favorite",
+    "api_shopingcart",
+)
+
+FILTER_INDEXES = {
+    "tags": {
+        "api_recipe_tags_recipe_id_tag_id_4e3605b4_uniq",
+        "api_recipe_tags_recipe_id_39cc25a8",
+    },
+    "author": {"recipe_author", "api_recipe_author_id_423d4c07"},
+    "is_favorited": {
+        "unique_favorite_recipe",
+        "favorite_recipe",
+        "sqlite_autoindex_api_favorite_1",
+    },
+    "is_in_shopping_cart": {
+        "unique_shoping_cart",
+        "shoping_cart_recipe",
+        "sqlite_autoindex_api_shopingcart_1",
+    },
+}
+
+
+def scanned_tables(plan):
+    if plan.get("Node Type") == "Seq Scan":
+        yield plan["Relation Name"]
+    for child in plan.get("Plans", ()):
+        yield from scanned_tables(child)
+
+
+def plan_indexes(plan):
+    if "Index Name" in plan:
+        yield plan["Index Name"]
+    for child in plan.get("Plans", ()):
+        yield from plan_indexes(child)
+
+
+def used_indexes(plan):
+    if isinstance(plan, dict):
+        return set(plan_indexes(plan))
+    return {
+        step.split(" INDEX ", 1)[1].split(" ", 1)[0]
+        for step in plan if " INDEX " in step
+    }
+
+
+def missing_indexes(query, plan):
+    indexes = used_indexes(plan)
+    return sorted(
+        name for name in query if not FILTER_INDEXES[name] & indexes)
+
+
+def explain(queryset):
+    sql, params = queryset.query.sql_with_params()
+    with connection.cursor() as cursor:
+        if connection.vendor == "postgresql":
+            cursor.execute("EXPLAIN (FORMAT JSON) " + sql, params)
+            plan = cursor.fetchone()[0]
+            if isinstance(plan, str):
+                plan = json.loads(plan)
+            plan = plan[0]["Plan"]
+            return plan, sorted(
+                set(scanned_tables(plan)).intersection(WATCHED_TABLES))
+        cursor.execute("EXPLAIN QUERY PLAN " + sql, params)
+        steps = [row[-1] for row in cursor.fetchall()]
+    return steps, [
+        step for step in steps
+        if step.startswith("SCAN ") and step != "SCAN api_recipe"
+        or step.startswith("USE TEMP B-TREE")
+    ]
+
+
+def combinations(params):
+    for size in range(len(params) + 1):
+        for names in itertools.combinations(params, size):
+            query = QueryDict(mutable=True)
+            for name in names:
+                query.setlist(name, params[name])
+            yield query
+
+
+def filter_params(context):
+    return {
+        "tags": [context["tag"].slug],
+        "author": [str(context["author"].id)],
+        "is_favorited": ["1"],
+        "is_in_shopping_cart": ["1"],
+    }
+
+
+class Command(BenchmarkCommand):
+    help = (
+        "seed a large throwaway PostgreSQL database and fail if any recipe "
+        "filter combination is planned with a sequential scan or without "
+        "the index meant for each of its filters"
+    )
+
+    def add_arguments(self, parser):
+        super().add_arguments(parser)
+        parser.set_defaults(
+            users=2000, recipes=50000, favorites=50, cart=20, follows=20)
+        parser.add_argument("--verbose-plans", action="store_true",
+                            help="print the full plan of every query")
+
+    def handle(self, *args, **options):
+        if connection.vendor != "postgresql":
+            raise CommandError("query plans are only checked on PostgreSQL")
+        old_name = connection.settings_dict["NAME"]
+        connection.creation.create_test_db(
+            verbosity=0, autoclobber=True, keepdb=options["keepdb"])
+        media_root = tempfile.mkdtemp(prefix="foodgram-plans-")
+        try:
+            with override_settings(
+                MEDIA_ROOT=media_root,
+                INGREDIENT_INDEX_PATH=os.path.join(
+                    media_root, "ingredients.idx"),
+            ):
+                context = self.seed(options)
+                with connection.cursor() as cursor:
+                    cursor.execute("ANALYZE")
+                failures = self.check_plans(context, options)
+        finally:
+            connection.creation.destroy_test_db(
+                old_name, verbosity=0, keepdb=options["keepdb"])
+        if failures:
+            raise CommandError(
+                "unindexed filters found:\n" + "\n".join(failures))
+        self.stdout.write(self.style.SUCCESS(
+            "every filter is served by its index"))
+
+    def check_plans(self, context, options):
+        request = APIRequestFactory().get("/api/recipes/")
+        request.user = context["user"]
+        failures = []
+        for query in combinations(filter_params(context)):
+            label = query.urlencode() or "(no filters)"
+            filterset = CustomRecipeFilter(
+                query, queryset=Recipe.objects.all(), request=request)
+            if not filterset.is_valid():
+                raise CommandError(f"{label}: {dict(filterset.errors)}")
+            plan, tables = explain(filterset.qs.order_by("-id")[:6])
+            missing = missing_indexes(query, plan)
+            status = "ok"
+            if tables:
+                status = "seq scan: " + ", ".join(tables)
+            elif missing:
+                status = "no index for: " + ", ".join(missing)
+            self.stdout.write(f"{label:<70}{status}")
+            if options["verbose_plans"]:
+                self.stdout.write(json.dumps(plan, indent=2))
+            if tables or missing:
+                failures.append(f"{label}: {status}")
+        return failures
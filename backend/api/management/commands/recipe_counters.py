@@ -0,0 +1,23 @@
+from api.models import Recipe
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+
+class Command(BaseCommand):
+    help = "recompute recipe favorite and shopping cart counters"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--batch-size", type=int, default=1000)
+
+    def handle(self, *args, **options):
+        batch_size = max(options["batch_size"], 1)
+        ids = Recipe.objects.order_by("id").values_list("id", flat=True)
+        fixed = last_id = 0
+        while True:
+            batch = list(ids.filter(id__gt=last_id)[:batch_size])
+            if not batch:
+                break
+            with transaction.atomic():
+                fixed += Recipe.objects.reconcile(batch[0], batch[-1])
+            last_id = batch[-1]
+        self.stdout.write(f"{fixed} recipes fixed")
@@ -0,0 +1,19 @@
+from api import search
+from api.models import DataVersion, Recipe
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+
+
+class Command(BaseCommand):
+    help = "rebuild the full-text search documents of all recipes"
+
+    def handle(self, *args, **options):
+        if not search.supported():
+            raise CommandError(
+                "full-text search needs PostgreSQL or SQLite with FTS5")
+        ids = list(Recipe.objects.values_list("id", flat=True))
+        with transaction.atomic():
+            search.clear()
+            search.update(ids)
+            DataVersion.objects.bump_on_commit(Recipe)
+        self.stdout.write(f"{len(ids)} recipes indexed")
@@ -0,0 +1,263 @@
+import base64
+import http.client
+import importlib.util
+import io
+import json
+import os
+import random
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+
+from api.management.commands.benchmark import Command as BenchmarkCommand
+from api.management.commands.benchmark import percentile
+from api.models import Favorite, Recipe
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.management.base import CommandError
+from django.db import connection
+from django.test.utils import override_settings
+from PIL import Image
+from rest_framework.authtoken.models import Token
+
+User = get_user_model()
+
+MODES = {
+    "wsgi": ("gunicorn",),
+    "asgi": ("gunicorn", "uvicorn"),
+}
+UPLOAD_CHUNK = 16 * 1024
+
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def upload_image(size, seed):
+    rnd = random.Random(seed)
+    image = Image.frombytes(
+        "RGB", (size, size), bytes(rnd.getrandbits(8) for _ in range(
+            size * size * 3)))
+    buffer = io.BytesIO()
+    image.save(buffer, "PNG")
+    return "data:image/png;base64," + base64.b64encode(
+        buffer.getvalue()).decode()
+
+
+class Command(BenchmarkCommand):
+    help = (
+        "seed a throwaway database, serve it with sync gunicorn workers "
+        "(wsgi) and uvicorn workers (asgi) and compare their throughput "
+        "under concurrent connections"
+    )
+
+    def add_arguments(self, parser):
+        super().add_arguments(parser)
+        parser.add_argument("--modes", default="wsgi,asgi")
+        parser.add_argument("--workers", type=int, default=2)
+        parser.add_argument("--connections", type=int, default=16)
+        parser.add_argument("--duration", type=float, default=5.0,
+                            help="seconds of load per scenario")
+        parser.add_argument("--image-size", type=int, default=512,
+                            help="side of the uploaded image in pixels")
+        parser.add_argument("--upload-delay", type=float, default=0.005,
+                            help="pause between 16 KiB upload chunks")
+
+    def get_modes(self, options):
+        modes = [mode for mode in options["modes"].split(",") if mode]
+        for mode in modes:
+            if mode not in MODES:
+                raise CommandError(f"unknown mode {mode}")
+            for module in MODES[mode]:
+                if importlib.util.find_spec(module) is None:
+                    raise CommandError(f"{mode} needs {module} installed")
+        return modes
+
+    def handle(self, *args, **options):
+        modes = self.get_modes(options)
+        old_name = connection.settings_dict["NAME"]
+        if connection.vendor == "sqlite":
+            connection.settings_dict["TEST"]["NAME"] = os.path.join(
+                tempfile.mkdtemp(prefix="foodgram-serve-"), "db.sqlite3")
+        connection.creation.create_test_db(
+            verbosity=0, autoclobber=True, keepdb=options["keepdb"])
+        media_root = tempfile.mkdtemp(prefix="foodgram-serve-")
+        results = {}
+        try:
+            with override_settings(
+                MEDIA_ROOT=media_root,
+                INGREDIENT_INDEX_PATH=os.path.join(
+                    media_root, "ingredients.idx"),
+            ):
+                scenarios = self.scenarios(self.seed(options), options)
+                for mode in modes:
+                    with self.server(mode, media_root, options) as port:
+                        for name, request in scenarios:
+                            if options["only"] in name:
+                                results[f"{name}:{mode}"] = self.load(
+                                    port, request, options)
+        finally:
+            connection.creation.destroy_test_db(
+                old_name, verbosity=0, keepdb=options["keepdb"])
+        self.report_load(results)
+        if options["output"]:
+            self.write_json(options["output"], results)
+
+    @contextmanager
+    def server(self, mode, media_root, options):
+        port = free_port()
+        process = subprocess.Popen(
+            [
+                sys.executable, "-m", "gunicorn",
+                "--config", "gunicorn.conf.py",
+                "--bind", f"127.0.0.1:{port}",
+                "--workers", str(options["workers"]),
+                "--log-level", "warning",
+            ],
+            cwd=settings.BASE_DIR,
+            env=dict(
+                os.environ,
+                SERVER_MODE=mode,
+                DB_NAME=connection.settings_dict["NAME"],
+                MEDIA_ROOT=media_root,
+            ),
+        )
+        try:
+            self.wait_for(port, process)
+            yield port
+        finally:
+            process.terminate()
+            process.wait()
+
+    def wait_for(self, port, process, timeout=30):
+        deadline = time.monotonic() + timeout
+        while time.monotonic() < deadline:
+            if process.poll() is not None:
+                raise CommandError("server exited before accepting requests")
+            try:
+                socket.create_connection(("127.0.0.1", port), 0.2).close()
+                return
+            except OSError:
+                time.sleep(0.1)
+        raise CommandError("server did not start")
+
+    def scenarios(self, context, options):
+        users = list(User.objects.exclude(id=context["spare"].id).order_by(
+            "id")[:options["connections"]])
+        tokens = [
+            Token.objects.get_or_create(user=user)[0].key for user in users]
+        recipes = list(Recipe.objects.order_by("id").values_list(
+            "id", flat=True))
+        Favorite.objects.filter(user__in=users, recipe_id__in=recipes[:len(
+            users)]).delete()
+        recipe = json.dumps({
+            "name": "Served recipe",
+            "text": "Served recipe text.",
+            "cooking_time": 10,
+            "image": upload_image(options["image_size"], options["seed"]),
+            "tags": [context["tag"].id],
+            "ingredients": [
+                {"id": item.id, "amount": 10}
+                for item in context["ingredients"][:10]
+            ],
+        }).encode()
+
+        def headers(worker):
+            return {"Authorization": f"Token {tokens[worker % len(tokens)]}"}
+
+        def recipes_list(worker, count):
+            return "GET", "/api/recipes/", None, {}, 0
+
+        def download(worker, count):
+            return ("GET", "/api/recipes/download_shopping_cart/", None,
+                    headers(worker), 0)
+
+        def favorite(worker, count):
+            method = "DELETE" if count % 2 else "POST"
+            path = f"/api/recipes/{recipes[worker % len(users)]}/favorite/"
+            return method, path, None, headers(worker), 0
+
+        def upload(worker, count):
+            return ("POST", "/api/recipes/", recipe, dict(
+                headers(worker), **{"Content-Type": "application/json"}),
+                options["upload_delay"])
+
+        return [
+            ("recipes-list", recipes_list),
+            ("download-cart", download),
+            ("favorite-toggle", favorite),
+            ("slow-upload", upload),
+        ]
+
+    def load(self, port, request, options):
+        deadline = time.monotonic() + options["duration"]
+        latencies = []
+        errors = []
+        lock = threading.Lock()
+
+        def worker(number):
+            client = http.client.HTTPConnection("127.0.0.1", port, timeout=60)
+            count = 0
+            while time.monotonic() < deadline:
+                method, path, body, headers, delay = request(number, count)
+                count += 1
+                started = time.perf_counter()
+                try:
+                    status = self.send(client, method, path, body, headers,
+                                       delay)
+                except (OSError, http.client.HTTPException):
+                    client.close()
+                    status = None
+                elapsed = (time.perf_counter() - started) * 1000
+                with lock:
+                    latencies.append(elapsed)
+                    if status is None or status >= 400:
+                        errors.append(status)
+            client.close()
+
+        started = time.monotonic()
+        with ThreadPoolExecutor(options["connections"]) as executor:
+            list(executor.map(worker, range(options["connections"])))
+        elapsed = time.monotonic() - started
+        return {
+            "requests": len(latencies),
+            "errors": len(errors),
+            "rps": round(len(latencies) / elapsed, 1),
+            "p50_ms": round(percentile(latencies, 50), 3) if latencies else 0,
+            "p95_ms": round(percentile(latencies, 95), 3) if latencies else 0,
+        }
+
+    def send(self, client, method, path, body, headers, delay):
+        if not delay or not body:
+            client.request(method, path, body, headers)
+        else:
+            client.putrequest(method, path)
+            for name, value in headers.items():
+                client.putheader(name, value)
+            client.putheader("Content-Length", str(len(body)))
+            client.endheaders()
+            for start in range(0, len(body), UPLOAD_CHUNK):
+                client.send(body[start:start + UPLOAD_CHUNK])
+                time.sleep(delay)
+        response = client.getresponse()
+        response.read()
+        return response.status
+
+    def report_load(self, results):
+        self.stdout.write(
+            f"{'scenario':<32}{'requests':>9}{'errors':>8}{'req/s':>9}"
+            f"{'p50 ms':>10}{'p95 ms':>10}"
+        )
+        for key, row in results.items():
+            self.stdout.write(
+                f"{key:<32}{row['requests']:>9}{row['errors']:>8}"
+                f"{row['rps']:>9.1f}{row['p50_ms']:>10.2f}"
+                f"{row['p95_ms']:>10.2f}"
+            )
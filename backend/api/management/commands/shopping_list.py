@@ -0,0 +1,72 @@
+from api.models import DataVersion, IngredientAmount, ShoppingListItem
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from django.db.models import Sum
+
+
+class Command(BaseCommand):
+    help = "rebuild or verify the per-user shopping list aggregate"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--verify", action="store_true",
+            help="only report users whose stored list is out of date",
+        )
+        parser.add_argument("--chunk-size", type=int, default=500)
+
+    def handle(self, *args, **options):
+        chunk_size = max(options["chunk_size"], 1)
+        users = (
+            set(IngredientAmount.objects.filter(
+                recipe__recipe_cart__isnull=False)
+                .values_list("recipe__recipe_cart__user", flat=True)
+                .distinct())
+            | set(ShoppingListItem.objects.values_list(
+                "user", flat=True).distinct())
+        )
+        users = sorted(users)
+        mismatched = 0
+        for start in range(0, len(users), chunk_size):
+            chunk = users[start:start + chunk_size]
+            expected = self.expected(chunk)
+            stored = {
+                (user, ingredient): total
+                for user, ingredient, total in ShoppingListItem.objects.filter(
+                    user__in=chunk).values_list(
+                        "user", "ingredient", "total_amount")
+            }
+            stale = {
+                user for (user, _), _ in (
+                    set(expected.items()) ^ set(stored.items()))
+            }
+            mismatched += len(stale)
+            if options["verify"] or not stale:
+                continue
+            with transaction.atomic():
+                ShoppingListItem.objects.filter(user__in=stale).delete()
+                ShoppingListItem.objects.bulk_create(
+                    ShoppingListItem(
+                        user_id=user, ingredient_id=ingredient,
+                        total_amount=total)
+                    for (user, ingredient), total in expected.items()
+                    if user in stale
+                )
+                DataVersion.objects.bump_on_commit(ShoppingListItem)
+        if not options["verify"]:
+            self.stdout.write(
+                f"{len(users)} shopping lists checked, {mismatched} rebuilt")
+        elif mismatched:
+            raise CommandError(
+                f"{mismatched} of {len(users)} shopping lists are out of date")
+        else:
+            self.stdout.write(f"{len(users)} shopping lists verified")
+
+    def expected(self, users):
+        return {
+            (user, ingredient): total
+            for user, ingredient, total in IngredientAmount.objects.filter(
+                recipe__recipe_cart__user__in=users)
+            .values_list("recipe__recipe_cart__user", "ingredient")
+            .annotate(total=Sum("amount"))
+            .order_by()
+        }
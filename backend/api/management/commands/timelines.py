@@ -0,0 +1,31 @@
+from api.models import Recipe, TimelineEntry
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.db.models import Count
+from users.models import Follow
+
+
+class Command(BaseCommand):
+    help = "rebuild the subscription feed timelines of all users"
+
+    def handle(self, *args, **options):
+        popular = (
+            Follow.objects.order_by()
+            .values("following")
+            .annotate(followers=Count("id"))
+            .filter(followers__gte=settings.FEED_FANOUT_LIMIT)
+            .values("following")
+        )
+        with transaction.atomic():
+            TimelineEntry.objects.all().delete()
+            Recipe.objects.exclude(in_timelines=True).update(in_timelines=True)
+            Recipe.objects.filter(author__in=popular).update(
+                in_timelines=False)
+            follows = Follow.objects.exclude(
+                following__in=popular).select_related("user")
+            for follow in follows.iterator():
+                TimelineEntry.objects.backfill(
+                    follow.user, follow.following_id)
+        self.stdout.write(
+            f"{TimelineEntry.objects.count()} timeline entries written")
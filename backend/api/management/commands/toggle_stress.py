@@ -0,0 +1,180 @@
+import json
+import logging
+import os
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from api.management.commands.benchmark import Command as BenchmarkCommand
+from api.management.commands.benchmark import percentile
+from api.models import (Favorite, Recipe, ShopingCart, ShoppingListItem,
+                        recipe_amounts)
+from django.core.management.base import CommandError
+from django.db import connection, connections
+from django.test.utils import override_settings
+from rest_framework.authtoken.models import Token
+from rest_framework.test import APIClient
+from users.models import Follow
+
+SUCCESS = {"POST": 201, "DELETE": 204}
+BULK_SUCCESS = {"POST": "added", "DELETE": "removed"}
+BULK_FAILURE = {"POST": "already_added", "DELETE": "not_added"}
+
+
+class Command(BenchmarkCommand):
+    help = (
+        "hammer the favorite, shopping cart and subscribe toggles and the "
+        "bulk favorite and shopping cart endpoints from many threads at once "
+        "and fail unless exactly one request of every burst wins and the "
+        "stored rows, counters and shopping list stay exact"
+    )
+
+    def add_arguments(self, parser):
+        super().add_arguments(parser)
+        parser.add_argument("--threads", type=int, default=16)
+        parser.add_argument("--rounds", type=int, default=20,
+                            help="add and remove bursts per toggle")
+
+    def handle(self, *args, **options):
+        old_name = connection.settings_dict["NAME"]
+        if connection.vendor == "sqlite":
+            connection.settings_dict["TEST"]["NAME"] = os.path.join(
+                tempfile.mkdtemp(prefix="foodgram-toggle-"), "db.sqlite3")
+        connection.creation.create_test_db(
+            verbosity=0, autoclobber=True, keepdb=options["keepdb"])
+        media_root = tempfile.mkdtemp(prefix="foodgram-toggle-")
+        try:
+            with override_settings(
+                ALLOWED_HOSTS=["*"],
+                MEDIA_ROOT=media_root,
+                INGREDIENT_INDEX_PATH=os.path.join(
+                    media_root, "ingredients.idx"),
+                CACHES={"default": {
+                    "BACKEND": "django.core.cache.backends.locmem.LocMemCache",
+                    "LOCATION": "toggle-stress",
+                }},
+            ):
+                context = self.seed(options)
+                results, failures = {}, []
+                for name, path, check, data in self.toggles(context):
+                    if options["only"] not in name:
+                        continue
+                    results[name] = self.hammer(
+                        context, path, check, options, failures, data)
+        finally:
+            connection.creation.destroy_test_db(
+                old_name, verbosity=0, keepdb=options["keepdb"])
+        self.report_toggles(results)
+        if failures:
+            raise CommandError("toggle races:\n" + "\n".join(failures))
+        self.stdout.write(self.style.SUCCESS("every burst had one winner"))
+
+    def toggles(self, context):
+        user = context["user"]
+        recipe = context["free_recipe"].id
+        author = context["author"].id
+
+        def relation(model, counter):
+            def check(present):
+                rows = model.objects.filter(user=user, recipe=recipe).count()
+                stored = getattr(Recipe.objects.get(id=recipe), counter)
+                actual = model.objects.filter(recipe=recipe).count()
+                errors = []
+                if rows != present:
+                    errors.append(f"{rows} rows")
+                if stored != actual:
+                    errors.append(f"{counter} {stored}, actual {actual}")
+                return errors
+            return check
+
+        def cart(present):
+            errors = relation(ShopingCart, "in_carts_count")(present)
+            expected = recipe_amounts(*ShopingCart.objects.filter(
+                user=user).values_list("recipe", flat=True))
+            stored = dict(ShoppingListItem.objects.filter(
+                user=user).values_list("ingredient", "total_amount"))
+            if stored != expected:
+                errors.append("shopping list differs from the cart")
+            return errors
+
+        def follow(present):
+            rows = Follow.objects.filter(
+                user=user, following=author).count()
+            return [] if rows == present else [f"{rows} rows"]
+
+        many = {"recipes": [recipe]}
+        return [
+            ("favorite", f"/api/recipes/{recipe}/favorite/",
+             relation(Favorite, "favorites_count"), None),
+            ("shopping-cart", f"/api/recipes/{recipe}/shopping_cart/", cart,
+             None),
+            ("subscribe", f"/api/users/{author}/subscribe/", follow, None),
+            ("favorite-many", "/api/recipes/favorite/",
+             relation(Favorite, "favorites_count"), many),
+            ("shopping-cart-many", "/api/recipes/shopping_cart/", cart, many),
+        ]
+
+    def hammer(self, context, path, check, options, failures, data=None):
+        threads = max(options["threads"], 2)
+        token, _ = Token.objects.get_or_create(user=context["user"])
+        barrier = threading.Barrier(threads)
+        latencies = []
+        lock = threading.Lock()
+
+        def request(method):
+            client = APIClient(raise_request_exception=False)
+            client.credentials(HTTP_AUTHORIZATION=f"Token {token.key}")
+            barrier.wait()
+            started = time.perf_counter()
+            if data is None:
+                response = client.generic(method, path)
+            else:
+                response = client.generic(
+                    method, path, json.dumps(data), "application/json")
+            elapsed = (time.perf_counter() - started) * 1000
+            with lock:
+                latencies.append(elapsed)
+            connections.close_all()
+            if data is None or response.status_code != 200:
+                return response.status_code
+            return response.data["results"][0]["status"]
+
+        logger = logging.getLogger("django.request")
+        level = logger.level
+        logger.setLevel(logging.ERROR)
+        started = time.perf_counter()
+        with ThreadPoolExecutor(threads) as executor:
+            for burst in range(max(options["rounds"], 1) * 2):
+                method = "DELETE" if burst % 2 else "POST"
+                statuses = list(executor.map(request, [method] * threads))
+                label = f"{path} {method} burst {burst // 2 + 1}"
+                if data is None:
+                    won, lost = SUCCESS[method], 400
+                else:
+                    won, lost = BULK_SUCCESS[method], BULK_FAILURE[method]
+                winners = statuses.count(won)
+                losers = statuses.count(lost)
+                if winners != 1 or winners + losers != threads:
+                    seen = sorted(set(map(str, statuses)))
+                    failures.append(
+                        f"{label}: statuses {seen}, {winners} succeeded")
+                for error in check(0 if burst % 2 else 1):
+                    failures.append(f"{label}: {error}")
+        elapsed = time.perf_counter() - started
+        logger.setLevel(level)
+        return {
+            "requests": len(latencies),
+            "rps": round(len(latencies) / elapsed, 1),
+            "p50_ms": round(percentile(latencies, 50), 3),
+            "p95_ms": round(percentile(latencies, 95), 3),
+        }
+
+    def report_toggles(self, results):
+        self.stdout.write(
+            f"{'toggle':<20}{'requests':>9}{'req/s':>9}{'p50 ms':>10}"
+            f"{'p95 ms':>10}")
+        for name, row in results.items():
+            self.stdout.write(
+                f"{name:<20}{row['requests']:>9}{row['rps']:>9.1f}"
+                f"{row['p50_ms']:>10.2f}{row['p95_ms']:>10.2f}")
@@ -0,0 +1,51 @@
+# Generated by Django 3.2 on 2026-10-18 17:56
+
+from django.db import migrations
+from django.db.models import Count, Min, Sum
+
+
+def merge_duplicate_ingredients(apps, schema_editor):
+    Ingredient = apps.get_model("api", "Ingredient")
+    IngredientAmount = apps.get_model("api", "IngredientAmount")
+    ShoppingListItem = apps.get_model("api", "ShoppingListItem")
+    duplicates = (
+        Ingredient.objects.values("name", "measurement_unit")
+        .annotate(keep=Min("id"), total=Count("id"))
+        .filter(total__gt=1)
+        .order_by()
+    )
+    for duplicate in duplicates:
+        group = Ingredient.objects.filter(
+            name=duplicate["name"],
+            measurement_unit=duplicate["measurement_unit"],
+        )
+        items = ShoppingListItem.objects.filter(ingredient__in=group)
+        users = set(items.values_list("user", flat=True))
+        items.delete()
+        IngredientAmount.objects.filter(ingredient__in=group).update(
+            ingredient=duplicate["keep"]
+        )
+        group.exclude(id=duplicate["keep"]).delete()
+        ShoppingListItem.objects.bulk_create(
+            ShoppingListItem(
+                user_id=user, ingredient_id=duplicate["keep"], total_amount=total
+            )
+            for user, total in IngredientAmount.objects.filter(
+                ingredient=duplicate["keep"],
+                recipe__recipe_cart__user__in=users,
+            )
+            .values_list("recipe__recipe_cart__user")
+            .annotate(total=Sum("amount"))
+            .order_by()
+        )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("api", "0014_shoppinglistitem"),
+    ]
+
+    operations = [
+        migrations.RunPython(merge_duplicate_ingredients, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,25 @@
+# Generated by Django 3.2 on 2026-10-18 18:07
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("api", "0018_recipe_cooking_time_index"),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name="favorite",
+            index=models.Index(fields=["recipe", "user"], name="favorite_recipe"),
+        ),
+        migrations.AddIndex(
+            model_name="recipe",
+            index=models.Index(fields=["author", "-id"], name="recipe_author"),
+        ),
+        migrations.AddIndex(
+            model_name="shopingcart",
+            index=models.Index(fields=["recipe", "user"], name="shoping_cart_recipe"),
+        ),
+    ]
@@ -0,0 +1,64 @@
+# Generated by Django 3.2 on 2026-10-18 18:11
+
+import api.storage
+from django.db import migrations, models
+from django.db.models import Count
+
+
+def count_image_references(apps, schema_editor):
+    MediaBlob = apps.get_model("api", "MediaBlob")
+    Recipe = apps.get_model("api", "Recipe")
+    MediaBlob.objects.bulk_create(
+        MediaBlob(name=row["image"], references=row["references"])
+        for row in Recipe.objects.exclude(image="")
+        .values("image")
+        .annotate(references=Count("id"))
+        .order_by()
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("api", "0020_recipe_image_derivatives"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="MediaBlob",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                (
+                    "name",
+                    models.CharField(max_length=255, unique=True, verbose_name="Name"),
+                ),
+                (
+                    "references",
+                    models.PositiveIntegerField(default=0, verbose_name="References"),
+                ),
+            ],
+            options={
+                "verbose_name": "Media blob",
+                "verbose_name_plural": "Media blobs",
+                "ordering": ("name",),
+            },
+        ),
+        migrations.AlterField(
+            model_name="recipe",
+            name="image",
+            field=models.ImageField(
+                storage=api.storage.ContentAddressedStorage(),
+                upload_to="media/",
+                verbose_name="Image",
+            ),
+        ),
+        migrations.RunPython(count_image_references, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,79 @@
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+POSTGRES_CREATE = (
+    "CREATE TABLE api_recipe_search ("
+    "recipe_id bigint PRIMARY KEY, vector tsvector NOT NULL)",
+    "CREATE INDEX api_recipe_search_vector ON api_recipe_search USING gin (vector)",
+    "INSERT INTO api_recipe_search (recipe_id, vector) "
+    "SELECT r.id, "
+    "setweight(to_tsvector(%(config)s::regconfig, r.name), 'A') || "
+    "setweight(to_tsvector(%(config)s::regconfig, "
+    "coalesce(string_agg(i.name, ' '), '')), 'B') || "
+    "setweight(to_tsvector(%(config)s::regconfig, r.text), 'C') "
+    "FROM api_recipe r "
+    "LEFT JOIN api_ingredientamount a ON a.recipe_id = r.id "
+    "LEFT JOIN api_ingredient i ON i.id = a.ingredient_id "
+    "GROUP BY r.id",
+)
+SQLITE_CREATE = (
+    "CREATE VIRTUAL TABLE api_recipe_search USING fts5("
+    "name, ingredients, text, recipe_id UNINDEXED, "
+    "tokenize='unicode61 remove_diacritics 2')",
+    "INSERT INTO api_recipe_search (rowid, name, ingredients, text, recipe_id) "
+    "SELECT r.id, r.name, coalesce(group_concat(i.name, ' '), ''), r.text, "
+    "r.id FROM api_recipe r "
+    "LEFT JOIN api_ingredientamount a ON a.recipe_id = r.id "
+    "LEFT JOIN api_ingredient i ON i.id = a.ingredient_id "
+    "GROUP BY r.id",
+)
+
+
+def create_search_table(apps, schema_editor):
+    vendor = schema_editor.connection.vendor
+    if vendor == "postgresql":
+        for statement in POSTGRES_CREATE:
+            schema_editor.execute(statement, {"config": settings.SEARCH_CONFIG})
+    elif vendor == "sqlite":
+        for statement in SQLITE_CREATE:
+            schema_editor.execute(statement)
+
+
+def drop_search_table(apps, schema_editor):
+    if schema_editor.connection.vendor in ("postgresql", "sqlite"):
+        schema_editor.execute("DROP TABLE IF EXISTS api_recipe_search")
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("api", "0021_mediablob"),
+    ]
+
+    operations = [
+        migrations.RunPython(create_search_table, drop_search_table),
+        migrations.CreateModel(
+            name="RecipeSearch",
+            fields=[
+                (
+                    "recipe",
+                    models.OneToOneField(
+                        db_constraint=False,
+                        on_delete=django.db.models.deletion.DO_NOTHING,
+                        primary_key=True,
+                        related_name="search_document",
+                        serialize=False,
+                        to="api.recipe",
+                        verbose_name="Recipe",
+                    ),
+                ),
+            ],
+            options={
+                "verbose_name": "Search document",
+                "verbose_name_plural": "Search documents",
+                "db_table": "api_recipe_search",
+                "managed": False,
+            },
+        ),
+    ]
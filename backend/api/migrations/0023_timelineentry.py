@@ -0,0 +1,89 @@
+# Generated by Django 3.2 on 2026-10-18 18:16
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ("api", "0022_recipe_search"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="TimelineEntry",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+            ],
+            options={
+                "verbose_name": "Timeline entry",
+                "verbose_name_plural": "Timeline entries",
+            },
+        ),
+        migrations.AddField(
+            model_name="recipe",
+            name="in_timelines",
+            field=models.BooleanField(
+                default=True, editable=False, verbose_name="Fanned out to timelines"
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="recipe",
+            index=models.Index(
+                condition=models.Q(in_timelines=False),
+                fields=["-id"],
+                name="recipe_read_path",
+            ),
+        ),
+        migrations.AddField(
+            model_name="timelineentry",
+            name="author",
+            field=models.ForeignKey(
+                on_delete=django.db.models.deletion.CASCADE,
+                related_name="+",
+                to=settings.AUTH_USER_MODEL,
+                verbose_name="Author",
+            ),
+        ),
+        migrations.AddField(
+            model_name="timelineentry",
+            name="recipe",
+            field=models.ForeignKey(
+                on_delete=django.db.models.deletion.CASCADE,
+                related_name="timeline_entries",
+                to="api.recipe",
+                verbose_name="Recipe",
+            ),
+        ),
+        migrations.AddField(
+            model_name="timelineentry",
+            name="user",
+            field=models.ForeignKey(
+                on_delete=django.db.models.deletion.CASCADE,
+                related_name="timeline",
+                to=settings.AUTH_USER_MODEL,
+                verbose_name="User",
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="timelineentry",
+            index=models.Index(fields=["user", "author"], name="timeline_author"),
+        ),
+        migrations.AddConstraint(
+            model_name="timelineentry",
+            constraint=models.UniqueConstraint(
+                fields=("user", "recipe"), name="unique_timeline_entry"
+            ),
+        ),
+    ]
@@ -0,0 +1,58 @@
+# Generated by Django 3.2 on 2026-10-18 18:20
+
+from django.db import migrations, models
+from django.db.models.functions import Coalesce
+
+
+def count_recipe_relations(apps, schema_editor):
+    Recipe = apps.get_model("api", "Recipe")
+    counters = {
+        "favorites_count": apps.get_model("api", "Favorite"),
+        "in_carts_count": apps.get_model("api", "ShopingCart"),
+    }
+    Recipe.objects.update(
+        **{
+            field: Coalesce(
+                models.Subquery(
+                    model.objects.filter(recipe=models.OuterRef("pk"))
+                    .order_by()
+                    .values("recipe")
+                    .annotate(count=models.Count("id"))
+                    .values("count")
+                ),
+                0,
+            )
+            for field, model in counters.items()
+        }
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("api", "0023_timelineentry"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="recipe",
+            name="favorites_count",
+            field=models.PositiveIntegerField(
+                default=0, editable=False, verbose_name="Favorites"
+            ),
+        ),
+        migrations.AddField(
+            model_name="recipe",
+            name="in_carts_count",
+            field=models.PositiveIntegerField(
+                default=0, editable=False, verbose_name="In shopping carts"
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="recipe",
+            index=models.Index(
+                fields=["-favorites_count", "-id"], name="recipe_favorites_count"
+            ),
+        ),
+        migrations.RunPython(count_recipe_relations, migrations.RunPython.noop),
+    ]
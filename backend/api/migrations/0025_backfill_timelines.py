@@ -0,0 +1,46 @@
+from django.conf import settings
+from django.db import migrations
+from django.db.models import Count
+
+
+def backfill_timelines(apps, schema_editor):
+    Follow = apps.get_model("users", "Follow")
+    Recipe = apps.get_model("api", "Recipe")
+    TimelineEntry = apps.get_model("api", "TimelineEntry")
+    authors = (
+        Follow.objects.order_by()
+        .values_list("following")
+        .annotate(followers=Count("id"))
+    )
+    for author, followers in list(authors):
+        recipes = Recipe.objects.filter(author=author)
+        if followers >= settings.FEED_FANOUT_LIMIT:
+            recipes.update(in_timelines=False)
+            continue
+        recipe_ids = list(
+            recipes.order_by("-id").values_list("id", flat=True)[
+                : settings.FEED_BACKFILL_LIMIT
+            ]
+        )
+        users = Follow.objects.filter(following=author).values_list("user", flat=True)
+        TimelineEntry.objects.bulk_create(
+            (
+                TimelineEntry(user_id=user, recipe_id=recipe, author_id=author)
+                for user in list(users)
+                for recipe in recipe_ids
+            ),
+            batch_size=settings.FEED_BATCH_SIZE,
+            ignore_conflicts=True,
+        )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("users", "0001_initial"),
+        ("api", "0024_recipe_counters"),
+    ]
+
+    operations = [
+        migrations.RunPython(backfill_timelines, migrations.RunPython.noop),
+    ]
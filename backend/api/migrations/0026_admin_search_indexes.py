@@ -0,0 +1,42 @@
+from django.conf import settings
+from django.db import migrations
+
+POSTGRES_CREATE = (
+    "CREATE INDEX ingredient_name_upper_like "
+    "ON api_ingredient (UPPER(name::text) text_pattern_ops)",
+)
+POSTGRES_DROP = ("DROP INDEX IF EXISTS ingredient_name_upper_like",)
+
+
+def user_table(apps, schema_editor):
+    return schema_editor.quote_name(
+        apps.get_model(settings.AUTH_USER_MODEL)._meta.db_table
+    )
+
+
+def create_indexes(apps, schema_editor):
+    schema_editor.execute(
+        f"CREATE INDEX user_email ON {user_table(apps, schema_editor)} (email)"
+    )
+    if schema_editor.connection.vendor == "postgresql":
+        for statement in POSTGRES_CREATE:
+            schema_editor.execute(statement)
+
+
+def drop_indexes(apps, schema_editor):
+    schema_editor.execute("DROP INDEX IF EXISTS user_email")
+    if schema_editor.connection.vendor == "postgresql":
+        for statement in POSTGRES_DROP:
+            schema_editor.execute(statement)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ("api", "0025_backfill_timelines"),
+    ]
+
+    operations = [
+        migrations.RunPython(create_indexes, drop_indexes),
+    ]
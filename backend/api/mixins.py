@@ -0,0 +1,53 @@
+import hashlib
+
+from api.models import DataVersion
+from django.utils.http import parse_etags, quote_etag
+from rest_framework.response import Response
+
+
+class NotModified(Exception):
+    pass
+
+
+class ConditionalGetMixin:
+    version_models = ()
+
+    def get_version_models(self):
+        return self.version_models
+
+    def get_etag(self, request):
+        models = self.get_version_models()
+        if request.method not in ("GET", "HEAD") or not models:
+            return None
+        versions = DataVersion.objects.versions(*models)
+        self.data_versions = dict(zip(models, versions))
+        key = "|".join(str(part) for part in (
+            self.__class__.__name__,
+            getattr(self, "action", ""),
+            request.user.id,
+            request.get_full_path(),
+            request.META.get("HTTP_ACCEPT", ""),
+            *versions,
+        ))
+        return quote_etag(hashlib.md5(key.encode()).hexdigest())
+
+    def initial(self, request, *args, **kwargs):
+        super().initial(request, *args, **kwargs)
+        self.etag = self.get_etag(request)
+        if_none_match = request.META.get("HTTP_IF_NONE_MATCH")
+        if self.etag and if_none_match:
+            etags = parse_etags(if_none_match)
+            if "*" in etags or self.etag in etags:
+                raise NotModified
+
+    def handle_exception(self, exc):
+        if isinstance(exc, NotModified):
+            return Response(status=304, headers={"ETag": self.etag})
+        return super().handle_exception(exc)
+
+    def finalize_response(self, request, response, *args, **kwargs):
+        response = super().finalize_response(
+            request, response, *args, **kwargs)
+        if getattr(self, "etag", None) and response.status_code == 200:
+            response["ETag"] = self.etag
+        return response
@@ -1,6 +1,15 @@
+from functools import partial
+
+from api import relations
+from api.storage import content_storage
+from api.utils import (delete_returning, insert_new, insert_or_add,
+                       insert_unique, on_commit_once)
+from django.conf import settings
 from django.contrib.auth import get_user_model
 from django.core.validators import MinValueValidator
-from django.db import models
+from django.db import IntegrityError, models, transaction
+from django.db.models.functions import Coalesce
+from users.models import Follow
 
 User = get_user_model()
 
@@ -33,11 +42,59 @@ class Ingredient(models.Model):
         ordering = ("id",)
         verbose_name = "Ingredient"
         verbose_name_plural = "Ingredients"
+        constraints = [
+            models.UniqueConstraint(
+                fields=("name", "measurement_unit"), name="unique_ingredient"
+            )
+        ]
 
     def __str__(self):
         return f"{self.name}"
 
 
+class RecipeManager(models.Manager):
+    counters = {
+        "favorites_count": "recipe_favorite",
+        "in_carts_count": "recipe_cart",
+    }
+
+    def change_counter(self, recipe_ids, field, delta):
+        recipes = self.filter(id__in=recipe_ids)
+        if delta < 0:
+            recipes = recipes.filter(**{f"{field}__gte": -delta})
+        recipes.update(**{field: models.F(field) + delta})
+
+    def actual_counters(self):
+        return {
+            field: Coalesce(models.Subquery(
+                self.model._meta.get_field(related).related_model.objects
+                .filter(recipe=models.OuterRef("pk"))
+                .order_by()
+                .values("recipe")
+                .annotate(count=models.Count("id"))
+                .values("count")
+            ), 0)
+            for field, related in self.counters.items()
+        }
+
+    def reconcile(self, first_id, last_id):
+        actual = self.actual_counters()
+        drifted = models.Q()
+        for field in actual:
+            drifted |= ~models.Q(**{field: models.F(f"actual_{field}")})
+        ids = list(
+            self.filter(id__gte=first_id, id__lte=last_id)
+            .annotate(**{
+                f"actual_{field}": value for field, value in actual.items()})
+            .filter(drifted)
+            .values_list("id", flat=True)
+        )
+        if ids:
+            self.filter(id__in=ids).update(**actual)
+            DataVersion.objects.bump_on_commit(self.model)
+        return len(ids)
+
+
 class Recipe(models.Model):
     tags = models.ManyToManyField(
         Tag, related_name="tags_recipe", verbose_name="Tag")
@@ -51,14 +108,37 @@ class Recipe(models.Model):
         Ingredient, related_name="ingredients_resipe", verbose_name="Ingredients"
     )
     name = models.CharField(max_length=200, verbose_name="Recipe name")
-    image = models.ImageField(upload_to="media/", verbose_name="Image")
+    image = models.ImageField(
+        upload_to="media/", storage=content_storage, verbose_name="Image")
+    image_derivatives = models.JSONField(
+        default=dict, blank=True, editable=False,
+        verbose_name="Image derivatives")
     text = models.TextField(max_length=2000, verbose_name="Text")
     cooking_time = models.PositiveSmallIntegerField(
         verbose_name="Cooking time", validators=[MinValueValidator(1)]
     )
+    in_timelines = models.BooleanField(
+        default=True, editable=False, verbose_name="Fanned out to timelines")
+    favorites_count = models.PositiveIntegerField(
+        default=0, editable=False, verbose_name="Favorites")
+    in_carts_count = models.PositiveIntegerField(
+        default=0, editable=False, verbose_name="In shopping carts")
+
+    objects = RecipeManager()
 
     class Meta:
         ordering = ("-id",)
+        indexes = [
+            models.Index(
+                fields=("cooking_time", "id"), name="recipe_cooking_time"),
+            models.Index(fields=("author", "-id"), name="recipe_author"),
+            models.Index(
+                fields=("-favorites_count", "-id"),
+                name="recipe_favorites_count"),
+            models.Index(
+                fields=("-id",), condition=models.Q(in_timelines=False),
+                name="recipe_read_path"),
+        ]
         verbose_name = "Recipe"
         verbose_name_plural = "Recipes"
 
@@ -91,6 +171,65 @@ class IngredientAmount(models.Model):
         return f"{self.ingredient}: {self.recipe}"
 
 
+class RecipeSearch(models.Model):
+    recipe = models.OneToOneField(
+        Recipe,
+        on_delete=models.DO_NOTHING,
+        db_constraint=False,
+        primary_key=True,
+        related_name="search_document",
+        verbose_name="Recipe",
+    )
+
+    class Meta:
+        managed = False
+        db_table = "api_recipe_search"
+        verbose_name = "Search document"
+        verbose_name_plural = "Search documents"
+
+
+class RecipeRelationManager(models.Manager):
+    def __init__(self, counter):
+        super().__init__()
+        self.counter = counter
+
+    def changed(self, user, recipe_ids, delta):
+        if not recipe_ids:
+            return
+        Recipe.objects.change_counter(recipe_ids, self.counter, delta)
+        DataVersion.objects.bump_on_commit(self.model)
+        transaction.on_commit(partial(relations.invalidate, user.id))
+
+    def add(self, user, recipe_id):
+        created = insert_unique(
+            self.model, {"user": user.id, "recipe": recipe_id},
+            Recipe, recipe_id)
+        if created is not None:
+            self.changed(user, [recipe_id], 1)
+        return created
+
+    def remove(self, user, recipe_id):
+        removed = self.remove_many(user, [recipe_id])
+        return bool(removed)
+
+    def add_many(self, user, recipe_ids):
+        if not recipe_ids:
+            return []
+        added = insert_new(self.model, [
+            {"user": user.id, "recipe": recipe} for recipe in recipe_ids
+        ], "recipe")
+        self.changed(user, added, 1)
+        return added
+
+    def remove_many(self, user, recipe_ids):
+        if not recipe_ids:
+            return []
+        removed = delete_returning(
+            self.model, {"user": user.id, "recipe": recipe_ids}, "recipe")
+        self.changed(user, removed, -1)
+        return removed
+
+
 class Favorite(models.Model):
     user = models.ForeignKey(
         User,
@@ -103,6 +242,8 @@ class Favorite(models.Model):
         verbose_name="Favorite recipe"
     )
 
+    objects = RecipeRelationManager("favorites_count")
+
     class Meta:
         ordering = ("-id",)
         verbose_name = "Favorite"
@@ -112,6 +253,9 @@ class Favorite(models.Model):
                 fields=("user", "recipe"), name="unique_favorite_recipe"
             )
         ]
+        indexes = [
+            models.Index(fields=("recipe", "user"), name="favorite_recipe"),
+        ]
 
     def __str__(self):
         return f"{self.user}: {self.recipe}"
@@ -131,6 +275,8 @@ class ShopingCart(models.Model):
         verbose_name="Rcipe",
     )
 
+    objects = RecipeRelationManager("in_carts_count")
+
     class Meta:
         ordering = ("id",)
         verbose_name = "Shoping cart"
@@ -140,6 +286,302 @@ class ShopingCart(models.Model):
                 fields=("user", "recipe"), name="unique_shoping_cart"
             )
         ]
+        indexes = [
+            models.Index(
+                fields=("recipe", "user"), name="shoping_cart_recipe"),
+        ]
 
     def __str__(self):
         return f"{self.user}: {self.recipe}"
+
+
+def recipe_amounts(*recipes):
+    return dict(
+        IngredientAmount.objects.filter(recipe__in=recipes)
+        .values_list("ingredient")
+        .annotate(total=models.Sum("amount"))
+        .order_by()
+    )
+
+
+class ShoppingListItemManager(models.Manager):
+    def apply(self, deltas):
+        deltas = {key: delta for key, delta in deltas.items() if delta}
+        if not deltas:
+            return
+        added = sorted(key for key, delta in deltas.items() if delta > 0)
+        subtracted = {
+            key: delta for key, delta in deltas.items() if delta < 0}
+        with transaction.atomic():
+            if added:
+                insert_or_add(self.model, [
+                    {
+                        "user": user,
+                        "ingredient": ingredient,
+                        "total_amount": deltas[user, ingredient],
+                    }
+                    for user, ingredient in added
+                ], ("user", "ingredient"), "total_amount")
+            if subtracted:
+                self.subtract(subtracted)
+            DataVersion.objects.bump_on_commit(self.model)
+
+    def subtract(self, deltas):
+        users = {user for user, _ in deltas}
+        ingredients = {ingredient for _, ingredient in deltas}
+        changed, removed = [], []
+        for item in self.select_for_update().filter(
+                user__in=users, ingredient__in=ingredients).order_by("id"):
+            delta = deltas.get((item.user_id, item.ingredient_id))
+            if delta is None:
+                continue
+            item.total_amount += delta
+            if item.total_amount > 0:
+                changed.append(item)
+            else:
+                removed.append(item.id)
+        if changed:
+            self.bulk_update(changed, ("total_amount",))
+        if removed:
+            self.filter(id__in=removed).delete()
+
+    def add_recipes(self, user_id, recipe_ids, sign=1):
+        self.apply({
+            (user_id, ingredient): sign * amount
+            for ingredient, amount in recipe_amounts(*recipe_ids).items()
+        })
+
+    def change_amounts(self, amounts):
+        deltas = {}
+        for recipe, ingredient, amount in amounts:
+            for user in ShopingCart.objects.filter(
+                    recipe=recipe).values_list("user", flat=True):
+                deltas[user, ingredient] = (
+                    deltas.get((user, ingredient), 0) + amount)
+        self.apply(deltas)
+
+    def change_recipe(self, recipe, old_amounts, new_amounts):
+        if old_amounts == new_amounts:
+            return
+        users = ShopingCart.objects.filter(recipe=recipe).values_list(
+            "user", flat=True)
+        ingredients = set(old_amounts) | set(new_amounts)
+        self.apply({
+            (user, ingredient): (
+                new_amounts.get(ingredient, 0)
+                - old_amounts.get(ingredient, 0))
+            for user in users
+            for ingredient in ingredients
+        })
+
+
+class ShoppingListItem(models.Model):
+    user = models.ForeignKey(
+        User,
+        on_delete=models.CASCADE,
+        related_name="shopping_list",
+        verbose_name="User",
+    )
+    ingredient = models.ForeignKey(
+        Ingredient,
+        on_delete=models.CASCADE,
+        related_name="shopping_list",
+        verbose_name="Ingredient",
+    )
+    total_amount = models.PositiveIntegerField(verbose_name="Total amount")
+
+    objects = ShoppingListItemManager()
+
+    class Meta:
+        verbose_name = "Shopping list item"
+        verbose_name_plural = "Shopping list items"
+        constraints = [
+            models.UniqueConstraint(
+                fields=("user", "ingredient"), name="unique_shopping_list_item"
+            )
+        ]
+
+    def __str__(self):
+        return f"{self.user}: {self.ingredient} {self.total_amount}"
+
+
+class TimelineEntryManager(models.Manager):
+    def followers(self, author_id):
+        return Follow.objects.filter(following_id=author_id)
+
+    def publish(self, recipe):
+        limit = settings.FEED_FANOUT_LIMIT
+        if self.followers(recipe.author_id)[:limit].count() >= limit:
+            Recipe.objects.filter(id=recipe.id).update(in_timelines=False)
+            recipe.in_timelines = False
+            return
+        transaction.on_commit(
+            partial(self.fan_out, recipe.id, recipe.author_id))
+
+    def fan_out(self, recipe_id, author_id):
+        followers = self.followers(author_id).order_by("user").values_list(
+            "user", flat=True)
+        last = 0
+        while True:
+            batch = list(followers.filter(
+                user__gt=last)[:settings.FEED_BATCH_SIZE])
+            if not batch:
+                break
+            self.bulk_create(
+                (self.model(user_id=user, recipe_id=recipe_id,
+                            author_id=author_id) for user in batch),
+                ignore_conflicts=True,
+            )
+            last = batch[-1]
+        DataVersion.objects.bump_on_commit(self.model)
+
+    def backfill(self, user, author_id):
+        recipes = Recipe.objects.filter(
+            author=author_id, in_timelines=True).order_by("-id").values_list(
+                "id", flat=True)[:settings.FEED_BACKFILL_LIMIT]
+        self.bulk_create(
+            (self.model(user=user, recipe_id=recipe, author_id=author_id)
+             for recipe in recipes),
+            ignore_conflicts=True,
+        )
+        DataVersion.objects.bump_on_commit(self.model)
+
+    def trim(self, user, author_id):
+        self.filter(user=user, author=author_id).delete()
+        DataVersion.objects.bump_on_commit(self.model)
+
+    def feed(self, user, before=None, limit=10):
+        entries = self.filter(user=user)
+        read_path = Recipe.objects.filter(
+            in_timelines=False,
+            author__in=Follow.objects.filter(user=user).values("following"),
+        )
+        if before is not None:
+            entries = entries.filter(recipe_id__lt=before)
+            read_path = read_path.filter(id__lt=before)
+        ids = set(entries.order_by("-recipe_id").values_list(
+            "recipe", flat=True)[:limit])
+        ids.update(read_path.order_by("-id").values_list(
+            "id", flat=True)[:limit])
+        return sorted(ids, reverse=True)[:limit]
+
+
+class TimelineEntry(models.Model):
+    user = models.ForeignKey(
+        User,
+        on_delete=models.CASCADE,
+        related_name="timeline",
+        verbose_name="User",
+    )
+    recipe = models.ForeignKey(
+        Recipe,
+        on_delete=models.CASCADE,
+        related_name="timeline_entries",
+        verbose_name="Recipe",
+    )
+    author = models.ForeignKey(
+        User,
+        on_delete=models.CASCADE,
+        related_name="+",
+        verbose_name="Author",
+    )
+
+    objects = TimelineEntryManager()
+
+    class Meta:
+        verbose_name = "Timeline entry"
+        verbose_name_plural = "Timeline entries"
+        constraints = [
+            models.UniqueConstraint(
+                fields=("user", "recipe"), name="unique_timeline_entry"
+            )
+        ]
+        indexes = [
+            models.Index(fields=("user", "author"), name="timeline_author"),
+        ]
+
+    def __str__(self):
+        return f"{self.user}: {self.recipe}"
+
+
+class DataVersionManager(models.Manager):
+    callbacks = {}
+
+    def bump(self, label):
+        if not self.filter(name=label).update(
+                version=models.F("version") + 1):
+            self.bulk_create(
+                [self.model(name=label, version=1)], ignore_conflicts=True)
+
+    def bump_on_commit(self, *models):
+        for model in models:
+            label = model._meta.label_lower
+            if label not in self.callbacks:
+                self.callbacks[label] = partial(self.bump, label)
+            on_commit_once(self.callbacks[label])
+
+    def versions(self, *models):
+        labels = [model._meta.label_lower for model in models]
+        versions = dict(
+            self.filter(name__in=labels).values_list("name", "version"))
+        return [versions.get(label, 0) for label in labels]
+
+
+class DataVersion(models.Model):
+    name = models.CharField(max_length=100, unique=True, verbose_name="Name")
+    version = models.PositiveBigIntegerField(
+        default=0, verbose_name="Version")
+
+    objects = DataVersionManager()
+
+    class Meta:
+        ordering = ("name",)
+        verbose_name = "Data version"
+        verbose_name_plural = "Data versions"
+
+    def __str__(self):
+        return f"{self.name}: {self.version}"
+
+
+class MediaBlobManager(models.Manager):
+    def acquire(self, name):
+        if self.filter(name=name).update(references=models.F("references") + 1):
+            return
+        try:
+            with transaction.atomic():
+                self.create(name=name, references=1)
+        except IntegrityError:
+            self.filter(name=name).update(
+                references=models.F("references") + 1)
+
+    def release(self, name):
+        self.filter(name=name, references__gt=0).update(
+            references=models.F("references") - 1)
+
+    def change(self, old, new):
+        if old == new:
+            return
+        if new:
+            self.acquire(new)
+        if old:
+            self.release(old)
+
+    def referenced(self, names):
+        return set(self.filter(
+            name__in=names, references__gt=0).values_list("name", flat=True))
+
+
+class MediaBlob(models.Model):
+    name = models.CharField(max_length=255, unique=True, verbose_name="Name")
+    references = models.PositiveIntegerField(
+        default=0, verbose_name="References")
+
+    objects = MediaBlobManager()
+
+    class Meta:
+        ordering = ("name",)
+        verbose_name = "Media blob"
+        verbose_name_plural = "Media blobs"
+
+    def __str__(self):
+        return f"{self.name}: {self.references}"
@@ -1,6 +1,323 @@
-from rest_framework.pagination import PageNumberPagination
+import base64
+import binascii
+import hashlib
+import json
+from collections import OrderedDict
+from functools import partial
+
+from api.filters import RecipeOrderingFilter
+from api.models import DataVersion, TimelineEntry
+from django.core.cache import cache
+from django.core.exceptions import ValidationError
+from django.core.paginator import Paginator
+from django.db import connections
+from django.db.models import Q
+from django.utils.functional import cached_property
+from rest_framework.exceptions import NotFound
+from rest_framework.pagination import BasePagination, PageNumberPagination
+from rest_framework.response import Response
+from rest_framework.utils.urls import remove_query_param, replace_query_param
+
+MIN_KEY, MAX_KEY = -2 ** 63, 2 ** 63 - 1
+
+
+def get_value(obj, name):
+    if isinstance(obj, dict):
+        return obj[name]
+    return getattr(obj, name)
+
+
+def estimate_count(queryset):
+    connection = connections[queryset.db]
+    if connection.vendor != "postgresql":
+        return None
+    if queryset.query.is_empty():
+        return 0
+    sql, params = queryset.order_by().query.sql_with_params()
+    with connection.cursor() as cursor:
+        cursor.execute("EXPLAIN (FORMAT JSON) " + sql, params)
+        plan = cursor.fetchone()[0]
+    if isinstance(plan, str):
+        plan = json.loads(plan)
+    return int(plan[0]["Plan"]["Plan Rows"])
+
+
+class CountedPaginator(Paginator):
+    def __init__(self, object_list, per_page, count=None, **kwargs):
+        super().__init__(object_list, per_page, **kwargs)
+        self.known_count = count
+
+    @cached_property
+    def count(self):
+        if self.known_count is None:
+            return super().count
+        return self.known_count
+
+
+class EstimatedCountPaginator(Paginator):
+    estimate_threshold = 10000
+    count_cache_timeout = 600
+
+    @cached_property
+    def count(self):
+        queryset = self.object_list
+        if not hasattr(queryset, "query") or queryset.query.is_empty():
+            return super().count
+        sql, params = queryset.order_by().query.sql_with_params()
+        signature = json.dumps([queryset.db, sql, params], default=str)
+        key = "estimate:" + hashlib.md5(signature.encode()).hexdigest()
+        count = cache.get(key)
+        if count is not None:
+            return count
+        count = estimate_count(queryset)
+        if count is None or count <= self.estimate_threshold:
+            return super().count
+        cache.set(key, count, self.count_cache_timeout)
+        return count
 
 
 class CustomPagination(PageNumberPagination):
     page_size = 6
     page_size_query_param = 'limit'
+    count_cache_timeout = 600
+    estimate_threshold = 10000
+    count_ignored_params = ("fields", "omit")
+
+    def get_count_key(self, request, view):
+        models = getattr(view, "count_version_models", ())
+        if not models:
+            return None
+        data_versions = getattr(view, "data_versions", {})
+        if all(model in data_versions for model in models):
+            versions = [data_versions[model] for model in models]
+        else:
+            versions = DataVersion.objects.versions(*models)
+        shared = getattr(view, "shared_count_params", ())
+        ignored = (self.page_query_param, self.page_size_query_param,
+                   *self.count_ignored_params)
+        params = sorted(
+            (key, sorted(set(values)))
+            for key, values in request.query_params.lists()
+            if key not in ignored and any(values)
+        )
+        user = request.user.id
+        if getattr(view, "shared_count", False) and all(
+                key in shared for key, _ in params):
+            user = ""
+        signature = json.dumps(
+            [view.__class__.__name__, user, params, versions])
+        return "count:" + hashlib.md5(signature.encode()).hexdigest()
+
+    def get_count(self, queryset, request, view):
+        key = self.get_count_key(request, view)
+        cached = cache.get(key) if key else None
+        if cached is not None:
+            return cached
+        estimate = estimate_count(queryset)
+        if estimate is not None and estimate > self.estimate_threshold:
+            count = (estimate, False)
+        else:
+            count = (queryset.count(), True)
+        if key:
+            cache.set(key, count, self.count_cache_timeout)
+        return count
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.count_exact = True
+        if self.get_page_size(request) and hasattr(queryset, "query"):
+            count, self.count_exact = self.get_count(queryset, request, view)
+            self.django_paginator_class = partial(
+                CountedPaginator, count=count)
+        return super().paginate_queryset(queryset, request, view)
+
+    def get_paginated_response(self, data):
+        return Response(OrderedDict([
+            ("count", self.page.paginator.count),
+            ("count_exact", self.count_exact),
+            ("next", self.get_next_link()),
+            ("previous", self.get_previous_link()),
+            ("results", data),
+        ]))
+
+    def get_paginated_response_schema(self, schema):
+        response_schema = super().get_paginated_response_schema(schema)
+        response_schema["properties"]["count_exact"] = {
+            "type": "boolean",
+            "example": True,
+        }
+        return response_schema
+
+
+def encode_cursor(ordering, key, reverse=False):
+    data = json.dumps([ordering, list(key), reverse], separators=(",", ":"))
+    return base64.urlsafe_b64encode(data.encode()).decode().rstrip("=")
+
+
+def decode_cursor(cursor):
+    try:
+        data = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4))
+        ordering, key, reverse = json.loads(data)
+    except (TypeError, ValueError, binascii.Error):
+        raise NotFound("Invalid cursor")
+    if not isinstance(ordering, str) or not isinstance(key, list) or any(
+            isinstance(value, bool) or not isinstance(value, (int, str))
+            for value in key):
+        raise NotFound("Invalid cursor")
+    return ordering, key, bool(reverse)
+
+
+class KeysetPagination(BasePagination):
+    cursor_query_param = "cursor"
+    ordering_query_param = "ordering"
+    page_size = 6
+    page_size_query_param = "limit"
+    max_page_size = 100
+    orderings = {
+        "-id": ("-id",),
+    }
+    default_ordering = "-id"
+
+    def get_page_size(self, request):
+        try:
+            page_size = int(request.query_params[self.page_size_query_param])
+        except (KeyError, ValueError):
+            return self.page_size
+        return min(max(page_size, 1), self.max_page_size)
+
+    def clean_key(self, queryset, fields, key):
+        if len(key) != len(fields):
+            raise NotFound("Invalid cursor")
+        try:
+            key = [
+                queryset.model._meta.get_field(field.lstrip("-")).clean(
+                    value, None)
+                for field, value in zip(fields, key)
+            ]
+        except ValidationError:
+            raise NotFound("Invalid cursor")
+        if any(isinstance(value, int) and not MIN_KEY <= value <= MAX_KEY
+               for value in key):
+            raise NotFound("Invalid cursor")
+        return key
+
+    def keyset_filter(self, fields, key, reverse):
+        condition = Q()
+        for field, value in reversed(list(zip(fields, key))):
+            descending = field.startswith("-") != reverse
+            name = field.lstrip("-")
+            after = Q(**{f"{name}__{'lt' if descending else 'gt'}": value})
+            if condition:
+                at_or_after = Q(
+                    **{f"{name}__{'lte' if descending else 'gte'}": value})
+                condition = at_or_after & (after | condition)
+            else:
+                condition = after
+        return condition
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.request = request
+        self.page_size = self.get_page_size(request)
+        cursor = request.query_params.get(self.cursor_query_param)
+        if cursor:
+            self.ordering, key, self.reverse = decode_cursor(cursor)
+            if self.ordering not in self.orderings:
+                raise NotFound("Invalid cursor")
+            key = self.clean_key(
+                queryset, self.orderings[self.ordering], key)
+        else:
+            self.ordering = request.query_params.get(
+                self.ordering_query_param, self.default_ordering)
+            if self.ordering not in self.orderings:
+                self.ordering = self.default_ordering
+            key, self.reverse = None, False
+        self.fields = self.orderings[self.ordering]
+        order_by = self.fields
+        if self.reverse:
+            order_by = [
+                field[1:] if field.startswith("-") else f"-{field}"
+                for field in self.fields
+            ]
+        queryset = queryset.order_by(*order_by)
+        if key is not None:
+            queryset = queryset.filter(
+                self.keyset_filter(self.fields, key, self.reverse))
+        results = list(queryset[:self.page_size + 1])
+        has_more = len(results) > self.page_size
+        results = results[:self.page_size]
+        if self.reverse:
+            results.reverse()
+            self.has_next, self.has_previous = True, has_more
+        else:
+            self.has_next, self.has_previous = has_more, key is not None
+        self.page = results
+        return results
+
+    def get_key(self, obj):
+        return [get_value(obj, field.lstrip("-")) for field in self.fields]
+
+    def get_link(self, obj, reverse):
+        url = remove_query_param(
+            self.request.build_absolute_uri(), self.ordering_query_param)
+        return replace_query_param(
+            url,
+            self.cursor_query_param,
+            encode_cursor(self.ordering, self.get_key(obj), reverse),
+        )
+
+    def get_next_link(self):
+        if not self.has_next or not self.page:
+            return None
+        return self.get_link(self.page[-1], False)
+
+    def get_previous_link(self):
+        if not self.has_previous or not self.page:
+            return None
+        return self.get_link(self.page[0], True)
+
+    def get_paginated_response(self, data):
+        return Response(OrderedDict([
+            ("next", self.get_next_link()),
+            ("previous", self.get_previous_link()),
+            ("results", data),
+        ]))
+
+    def get_paginated_response_schema(self, schema):
+        return {
+            "type": "object",
+            "properties": {
+                "next": {"type": "string", "nullable": True},
+                "previous": {"type": "string", "nullable": True},
+                "results": schema,
+            },
+        }
+
+
+class RecipeKeysetPagination(KeysetPagination):
+    orderings = RecipeOrderingFilter.orderings
+
+
+class FeedPagination(KeysetPagination):
+    def paginate_queryset(self, queryset, request, view=None):
+        self.request = request
+        self.page_size = self.get_page_size(request)
+        self.ordering = self.default_ordering
+        self.fields = self.orderings[self.ordering]
+        before = None
+        cursor = request.query_params.get(self.cursor_query_param)
+        if cursor:
+            ordering, key, reverse = decode_cursor(cursor)
+            if ordering != self.ordering or reverse:
+                raise NotFound("Invalid cursor")
+            before, = self.clean_key(queryset, self.fields, key)
+        ids = TimelineEntry.objects.feed(
+            request.user, before=before, limit=self.page_size + 1)
+        self.has_next = len(ids) > self.page_size
+        self.has_previous = False
+        ids = ids[:self.page_size]
+        recipes = {
+            get_value(recipe, "id"): recipe
+            for recipe in queryset.filter(id__in=ids).order_by()
+        }
+        self.page = [
+            recipes[recipe_id] for recipe_id in ids if recipe_id in recipes]
+        return self.page
@@ -0,0 +1,32 @@
+import codecs
+import io
+import re
+
+from api.renderers import FastJSONRenderer
+from django.conf import settings
+from rest_framework.parsers import JSONParser
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+LONG_NUMBER = re.compile(rb"\d{19}")
+
+
+class FastJSONParser(JSONParser):
+    renderer_class = FastJSONRenderer
+
+    def parse(self, stream, media_type=None, parser_context=None):
+        parser_context = parser_context or {}
+        encoding = parser_context.get("encoding", settings.DEFAULT_CHARSET)
+        if orjson is None or not self.strict or (
+                codecs.lookup(encoding).name != "utf-8"):
+            return super().parse(stream, media_type, parser_context)
+        data = stream.read()
+        if not LONG_NUMBER.search(data):
+            try:
+                return orjson.loads(data)
+            except orjson.JSONDecodeError:
+                pass
+        return super().parse(io.BytesIO(data), media_type, parser_context)
@@ -0,0 +1,173 @@
+from collections import defaultdict
+
+from api.images import image_urls
+from api.models import IngredientAmount, Tag
+from api.relations import get_relations
+from api.storage import content_storage
+
+
+class Projection:
+    def __init__(self, **fields):
+        self.keys = tuple(fields)
+        self.lookups = tuple(fields.values())
+
+    def rows(self, queryset):
+        keys = self.keys
+        return [
+            dict(zip(keys, values))
+            for values in queryset.values_list(*self.lookups)
+        ]
+
+    def group(self, queryset, by):
+        keys = self.keys
+        groups = defaultdict(list)
+        for group, *values in queryset.values_list(by, *self.lookups):
+            groups[group].append(dict(zip(keys, values)))
+        return groups
+
+
+TAG = Projection(id="id", name="name", color="color", slug="slug")
+INGREDIENT = Projection(
+    id="id", name="name", measurement_unit="measurement_unit")
+INGREDIENT_AMOUNT = Projection(
+    id="ingredient_id",
+    name="ingredient__name",
+    measurement_unit="ingredient__measurement_unit",
+    amount="amount",
+)
+RECIPE_FOR_FOLLOW = Projection(
+    id="id",
+    name="name",
+    image="image",
+    images="image_derivatives",
+    cooking_time="cooking_time",
+)
+RECIPE_COLUMNS = {
+    "id": ("id",),
+    "tags": (),
+    "author": (
+        "author",
+        "author__email",
+        "author__username",
+        "author__first_name",
+        "author__last_name",
+    ),
+    "ingredients": (),
+    "name": ("name",),
+    "image": ("image",),
+    "images": ("image", "image_derivatives"),
+    "text": ("text",),
+    "cooking_time": ("cooking_time",),
+    "favorites_count": ("favorites_count",),
+    "in_carts_count": ("in_carts_count",),
+    "is_favorited": (),
+    "is_in_shopping_cart": (),
+}
+RECIPE_FIELDS = tuple(RECIPE_COLUMNS)
+RECIPE_CARD_FIELDS = tuple(
+    field for field in RECIPE_FIELDS if field not in ("ingredients", "text"))
+RECIPE_KEY_COLUMNS = ("id", "cooking_time", "favorites_count")
+FOLLOW_COLUMNS = {
+    "email": ("following__email",),
+    "id": ("following",),
+    "username": ("following__username",),
+    "first_name": ("following__first_name",),
+    "last_name": ("following__last_name",),
+    "is_subscribed": ("user", "following"),
+    "recipes": ("following",),
+    "recipes_count": ("recipes_count",),
+}
+FOLLOW_FIELDS = tuple(FOLLOW_COLUMNS)
+
+
+def columns(mapping, fields, required=()):
+    return tuple(dict.fromkeys((
+        *required,
+        *(column for field in fields for column in mapping[field]),
+    )))
+
+
+def file_url(name, request=None):
+    if not name:
+        return None
+    url = content_storage.url(name)
+    return request.build_absolute_uri(url) if request else url
+
+
+def ingredients(queryset):
+    return INGREDIENT.rows(queryset)
+
+
+def recipe_rows(queryset, fields=RECIPE_FIELDS):
+    return queryset.values(
+        *columns(RECIPE_COLUMNS, fields, RECIPE_KEY_COLUMNS))
+
+
+def recipes(rows, request, fields=RECIPE_FIELDS):
+    ids = [row["id"] for row in rows]
+    if not ids:
+        return []
+    tags = amounts = {}
+    if "tags" in fields:
+        tags = TAG.group(
+            Tag.objects.filter(tags_recipe__in=ids), "tags_recipe")
+    if "ingredients" in fields:
+        amounts = INGREDIENT_AMOUNT.group(
+            IngredientAmount.objects.filter(recipe__in=ids), "recipe_id")
+    relations = get_relations(request)
+    values = {
+        "id": lambda row: row["id"],
+        "tags": lambda row: tags.get(row["id"], []),
+        "author": lambda row: {
+            "email": row["author__email"],
+            "id": row["author"],
+            "username": row["author__username"],
+            "first_name": row["author__first_name"],
+            "last_name": row["author__last_name"],
+            "is_subscribed": row["author"] in relations.following,
+        },
+        "ingredients": lambda row: amounts.get(row["id"], []),
+        "name": lambda row: row["name"],
+        "image": lambda row: file_url(row["image"], request),
+        "images": lambda row: image_urls(
+            row["image"], row["image_derivatives"], request),
+        "text": lambda row: row["text"],
+        "cooking_time": lambda row: row["cooking_time"],
+        "favorites_count": lambda row: row["favorites_count"],
+        "in_carts_count": lambda row: row["in_carts_count"],
+        "is_favorited": lambda row: row["id"] in relations.favorites,
+        "is_in_shopping_cart": lambda row: row["id"] in relations.cart,
+    }
+    getters = [(field, values[field]) for field in fields]
+    return [{field: value(row) for field, value in getters} for row in rows]
+
+
+def follow_rows(queryset, fields=FOLLOW_FIELDS):
+    return queryset.values(*columns(FOLLOW_COLUMNS, fields, ("following",)))
+
+
+def follows(rows, author_recipes, request, fields=FOLLOW_FIELDS):
+    authors = [row["following"] for row in rows]
+    if not authors:
+        return []
+    recipes = {}
+    if "recipes" in fields:
+        recipes = RECIPE_FOR_FOLLOW.group(author_recipes(authors), "author_id")
+        for items in recipes.values():
+            for recipe in items:
+                recipe["images"] = image_urls(
+                    recipe["image"], recipe["images"])
+                recipe["image"] = file_url(recipe["image"])
+    values = {
+        "email": lambda row: row["following__email"],
+        "id": lambda row: row["following"],
+        "username": lambda row: row["following__username"],
+        "first_name": lambda row: row["following__first_name"],
+        "last_name": lambda row: row["following__last_name"],
+        "is_subscribed": lambda row: row["user"] == request.user.id or (
+            row["following"] in get_relations(request).following),
+        "recipes": lambda row: recipes.get(row["following"], []),
+        "recipes_count": lambda row: row["recipes_count"],
+    }
+    getters = [(field, values[field]) for field in fields]
+    return [{field: value(row) for field, value in getters} for row in rows]
@@ -0,0 +1,59 @@
+from array import array
+from collections import namedtuple
+
+from django.conf import settings
+from django.core.cache import caches
+
+KEY = "relations:{}"
+
+Relations = namedtuple("Relations", ("favorites", "cart", "following"))
+
+EMPTY = Relations(frozenset(), frozenset(), frozenset())
+
+
+def get_cache():
+    return caches[settings.RELATIONS_CACHE]
+
+
+def pack(ids):
+    return array("q", sorted(ids)).tobytes()
+
+
+def unpack(data):
+    ids = array("q")
+    ids.frombytes(data)
+    return frozenset(ids)
+
+
+def load(user_id):
+    from api.models import Favorite, ShopingCart
+    from users.models import Follow
+
+    cache = get_cache()
+    key = KEY.format(user_id)
+    packed = cache.get(key)
+    if packed is None:
+        packed = (
+            pack(Favorite.objects.filter(user_id=user_id)
+                 .values_list("recipe_id", flat=True)),
+            pack(ShopingCart.objects.filter(user_id=user_id)
+                 .values_list("recipe_id", flat=True)),
+            pack(Follow.objects.filter(user_id=user_id)
+                 .values_list("following_id", flat=True)),
+        )
+        cache.set(key, packed, settings.RELATIONS_CACHE_TIMEOUT)
+    return Relations(*map(unpack, packed))
+
+
+def get_relations(request):
+    if request is None or request.user.is_anonymous:
+        return EMPTY
+    relations = getattr(request, "user_relations", None)
+    if relations is None:
+        relations = load(request.user.id)
+        request.user_relations = relations
+    return relations
+
+
+def invalidate(user_id):
+    get_cache().delete(KEY.format(user_id))
@@ -0,0 +1,90 @@
+import csv
+import decimal
+import json
+
+from rest_framework.renderers import BaseRenderer, JSONRenderer
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+LINE_SEPARATORS = (
+    (b"\xe2\x80\xa8", b"\\u2028"),
+    (b"\xe2\x80\xa9", b"\\u2029"),
+)
+
+
+class Echo:
+    def write(self, value):
+        return value
+
+
+class ShoppingListTextRenderer(BaseRenderer):
+    media_type = "text/plain"
+    format = "txt"
+    charset = "utf-8"
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if data is None:
+            return b""
+        return json.dumps(data, ensure_ascii=False).encode(self.charset)
+
+    def stream(self, ingredients):
+        yield "Ingredient list\n\n"
+        for ingredient in ingredients:
+            yield (
+                f" {ingredient['name']} - {ingredient['amount']} "
+                f"{ingredient['measurement_unit']}\n"
+            )
+
+
+class ShoppingListCSVRenderer(ShoppingListTextRenderer):
+    media_type = "text/csv"
+    format = "csv"
+
+    def stream(self, ingredients):
+        writer = csv.writer(Echo())
+        yield writer.writerow(("name", "amount", "measurement_unit"))
+        for ingredient in ingredients:
+            yield writer.writerow((
+                ingredient["name"],
+                ingredient["amount"],
+                ingredient["measurement_unit"],
+            ))
+
+
+class ShoppingListJSONRenderer(JSONRenderer):
+    def stream(self, ingredients):
+        separator = "["
+        for ingredient in ingredients:
+            yield separator + json.dumps(ingredient, ensure_ascii=False)
+            separator = ","
+        yield "[]" if separator == "[" else "]"
+
+
+class FastJSONRenderer(JSONRenderer):
+    def default(self, obj):
+        if isinstance(obj, decimal.Decimal):
+            value = float(obj)
+            if value and not 1e-4 <= abs(value) < 1e16:
+                raise TypeError("float repr differs from json")
+            return value
+        return self.encoder_class().default(obj)
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if (
+            orjson is None or data is None or self.ensure_ascii
+            or not self.compact or not self.strict
+            or self.get_indent(accepted_media_type, renderer_context or {})
+        ):
+            return super().render(data, accepted_media_type, renderer_context)
+        try:
+            ret = orjson.dumps(data, default=self.default, option=(
+                orjson.OPT_PASSTHROUGH_DATETIME | orjson.OPT_NON_STR_KEYS))
+        except orjson.JSONEncodeError:
+            return super().render(data, accepted_media_type, renderer_context)
+        for separator, escaped in LINE_SEPARATORS:
+            if separator in ret:
+                ret = ret.replace(separator, escaped)
+        return ret
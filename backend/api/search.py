@@ -0,0 +1,107 @@
+import re
+
+from django.conf import settings
+from django.db import connection
+from django.db.models import BooleanField
+from django.db.models.expressions import RawSQL
+
+TABLE = "api_recipe_search"
+CHUNK_SIZE = 500
+
+POSTGRES_UPDATE = (
+    f"INSERT INTO {TABLE} (recipe_id, vector) "
+    "SELECT r.id, "
+    "setweight(to_tsvector(%(config)s::regconfig, r.name), 'A') || "
+    "setweight(to_tsvector(%(config)s::regconfig, "
+    "coalesce(string_agg(i.name, ' '), '')), 'B') || "
+    "setweight(to_tsvector(%(config)s::regconfig, r.text), 'C') "
+    "FROM api_recipe r "
+    "LEFT JOIN api_ingredientamount a ON a.recipe_id = r.id "
+    "LEFT JOIN api_ingredient i ON i.id = a.ingredient_id "
+    "WHERE r.id = ANY(%(ids)s) GROUP BY r.id "
+    "ON CONFLICT (recipe_id) DO UPDATE SET vector = EXCLUDED.vector"
+)
+POSTGRES_MATCH = (
+    f"{TABLE}.vector @@ websearch_to_tsquery(%s::regconfig, %s)")
+POSTGRES_RANK = (
+    f"ts_rank_cd({TABLE}.vector, websearch_to_tsquery(%s::regconfig, %s))")
+
+SQLITE_UPDATE = (
+    f"INSERT INTO {TABLE} (rowid, name, ingredients, text, recipe_id) "
+    "SELECT r.id, r.name, coalesce(group_concat(i.name, ' '), ''), r.text, "
+    "r.id FROM api_recipe r "
+    "LEFT JOIN api_ingredientamount a ON a.recipe_id = r.id "
+    "LEFT JOIN api_ingredient i ON i.id = a.ingredient_id "
+    "WHERE r.id IN ({}) GROUP BY r.id"
+)
+SQLITE_MATCH = f"{TABLE} MATCH %s"
+SQLITE_RANK = f"-bm25({TABLE}, 10.0, 5.0, 1.0)"
+
+
+def supported(using=connection):
+    return using.vendor in ("postgresql", "sqlite")
+
+
+def chunks(ids):
+    ids = sorted(set(ids))
+    for start in range(0, len(ids), CHUNK_SIZE):
+        yield ids[start:start + CHUNK_SIZE]
+
+
+def update(recipe_ids, using=connection):
+    if not supported(using):
+        return
+    with using.cursor() as cursor:
+        for chunk in chunks(recipe_ids):
+            if using.vendor == "postgresql":
+                cursor.execute(POSTGRES_UPDATE, {
+                    "config": settings.SEARCH_CONFIG, "ids": chunk})
+                continue
+            placeholders = ", ".join(["%s"] * len(chunk))
+            cursor.execute(
+                f"DELETE FROM {TABLE} WHERE rowid IN ({placeholders})",
+                chunk)
+            cursor.execute(SQLITE_UPDATE.format(placeholders), chunk)
+
+
+def remove(recipe_ids, using=connection):
+    if not supported(using):
+        return
+    column = "recipe_id" if using.vendor == "postgresql" else "rowid"
+    with using.cursor() as cursor:
+        for chunk in chunks(recipe_ids):
+            placeholders = ", ".join(["%s"] * len(chunk))
+            cursor.execute(
+                f"DELETE FROM {TABLE} WHERE {column} IN ({placeholders})",
+                chunk)
+
+
+def clear(using=connection):
+    if supported(using):
+        with using.cursor() as cursor:
+            cursor.execute(f"DELETE FROM {TABLE}")
+
+
+def fts5_query(terms):
+    return " ".join(f'"{word}"*' for word in re.findall(r"\w+", terms))
+
+
+def search(queryset, terms):
+    vendor = connection.vendor
+    if vendor == "postgresql":
+        params = (settings.SEARCH_CONFIG, terms)
+        match, rank = POSTGRES_MATCH, POSTGRES_RANK
+    elif vendor == "sqlite":
+        terms = fts5_query(terms)
+        if not terms:
+            return queryset.none()
+        params = (terms,)
+        match, rank = SQLITE_MATCH, SQLITE_RANK
+    else:
+        return queryset.filter(name__icontains=terms)
+    return queryset.filter(
+        RawSQL(match, params, output_field=BooleanField()),
+        search_document__isnull=False,
+    ).annotate(
+        search_rank=RawSQL(rank, params if vendor == "postgresql" else ()),
+    ).order_by("-search_rank", "-id")
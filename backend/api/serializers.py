@@ -1,9 +1,13 @@
+from api.images import derivative_urls
 from api.models import (Favorite, Ingredient, IngredientAmount, Recipe,
-                        ShopingCart, Tag)
+                        ShopingCart, ShoppingListItem, Tag)
+from api.relations import get_relations
 from django.contrib.auth import get_user_model
+from django.db import transaction
 from drf_extra_fields.fields import Base64ImageField
 from rest_framework import serializers
 from rest_framework.exceptions import ValidationError
+from rest_framework.relations import MANY_RELATION_KWARGS
 from users.serializers import CustomUserSerializer
 
 User = get_user_model()
@@ -32,6 +36,18 @@ class IngredientAmountSerializer(serializers.ModelSerializer):
         fields = ("id", "name", "measurement_unit", "amount")
 
 
+class ShoppingListItemSerializer(serializers.ModelSerializer):
+    id = serializers.ReadOnlyField(source="ingredient.id")
+    name = serializers.ReadOnlyField(source="ingredient.name")
+    measurement_unit = serializers.ReadOnlyField(
+        source="ingredient.measurement_unit")
+    amount = serializers.ReadOnlyField(source="total_amount")
+
+    class Meta:
+        model = ShoppingListItem
+        fields = ("id", "name", "measurement_unit", "amount")
+
+
 class ShoppingCartSerializer(serializers.ModelSerializer):
     recipe = serializers.PrimaryKeyRelatedField(queryset=Recipe.objects.all())
     user = serializers.PrimaryKeyRelatedField(queryset=User.objects.all())
@@ -59,12 +75,24 @@ class FavoriteSerializer(serializers.ModelSerializer):
         fields = ("recipe", "user")
 
 
+class RecipeIdsSerializer(serializers.Serializer):
+    recipes = serializers.ListField(
+        child=serializers.IntegerField(min_value=1),
+        allow_empty=False,
+        max_length=500,
+    )
+
+    def validate_recipes(self, recipes):
+        return list(dict.fromkeys(recipes))
+
+
 class ListRecipeSerializer(serializers.ModelSerializer):
     tags = TagSerializer(many=True, read_only=True)
     author = CustomUserSerializer(read_only=True)
     ingredients = serializers.SerializerMethodField()
     is_favorited = serializers.SerializerMethodField()
     is_in_shopping_cart = serializers.SerializerMethodField()
+    images = serializers.SerializerMethodField()
 
     class Meta:
         model = Recipe
@@ -75,40 +103,108 @@ class ListRecipeSerializer(serializers.ModelSerializer):
             "ingredients",
             "name",
             "image",
+            "images",
             "text",
             "image",
             "cooking_time",
+            "favorites_count",
+            "in_carts_count",
             "is_favorited",
             "is_in_shopping_cart",
         )
 
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        fields = self.context.get("fields")
+        if fields is not None:
+            for name in set(self.fields).difference(fields):
+                self.fields.pop(name)
+
     def get_ingredients(self, obj):
-        all_ingredients = IngredientAmount.objects.filter(recipe=obj)
+        all_ingredients = obj.recipe_shop.all()
         return IngredientAmountSerializer(all_ingredients, many=True).data
 
+    def get_images(self, obj):
+        return derivative_urls(obj, self.context.get("request"))
+
     def get_is_favorited(self, obj):
-        request = self.context.get('request')
-        if not request or request.user.is_anonymous:
-            return False
-        return Favorite.objects.filter(recipe=obj, user=request.user).exists()
+        relations = get_relations(self.context.get("request"))
+        return obj.id in relations.favorites
 
     def get_is_in_shopping_cart(self, obj):
-        request = self.context.get('request')
-        if not request or request.user.is_anonymous:
-            return False
-        return ShopingCart.objects.filter(
-            recipe=obj,
-            user=request.user
-        ).exists()
+        relations = get_relations(self.context.get("request"))
+        return obj.id in relations.cart
+
+
+class BulkManyRelatedField(serializers.ManyRelatedField):
+    def to_internal_value(self, data):
+        if isinstance(data, str) or not hasattr(data, "__iter__"):
+            self.fail("not_a_list", input_type=type(data).__name__)
+        if not self.allow_empty and len(data) == 0:
+            self.fail("empty")
+        pks = [self.child_relation.to_pk(value) for value in data]
+        objects = self.child_relation.get_queryset().in_bulk(set(pks))
+        for value, pk in zip(data, pks):
+            if pk not in objects:
+                self.child_relation.fail("does_not_exist", pk_value=value)
+        return [objects[pk] for pk in pks]
+
+
+class BulkPrimaryKeyRelatedField(serializers.PrimaryKeyRelatedField):
+    existing = None
+
+    @classmethod
+    def many_init(cls, *args, **kwargs):
+        list_kwargs = {"child_relation": cls(*args, **kwargs)}
+        for key in kwargs:
+            if key in MANY_RELATION_KWARGS:
+                list_kwargs[key] = kwargs[key]
+        return BulkManyRelatedField(**list_kwargs)
+
+    def to_pk(self, data):
+        if data is None:
+            self.fail("does_not_exist", pk_value=data)
+        if isinstance(data, bool):
+            self.fail("incorrect_type", data_type=type(data).__name__)
+        try:
+            return int(data)
+        except (TypeError, ValueError):
+            self.fail("incorrect_type", data_type=type(data).__name__)
+
+    def to_internal_value(self, data):
+        pk = self.to_pk(data)
+        if self.existing is not None and pk not in self.existing:
+            self.fail("does_not_exist", pk_value=data)
+        return pk
+
+
+class AddRecipeIngredientsListSerializer(serializers.ListSerializer):
+    def to_internal_value(self, data):
+        field = self.child.fields["id"]
+        if isinstance(data, list):
+            field.existing = set(field.get_queryset().filter(
+                id__in=self.ids(data, field)).values_list("id", flat=True))
+        return super().to_internal_value(data)
+
+    @staticmethod
+    def ids(data, field):
+        ids = set()
+        for item in data:
+            try:
+                ids.add(field.to_pk(item["id"]))
+            except (KeyError, TypeError, ValidationError):
+                continue
+        return ids
 
 
 class AddRecipeIngredientsSerializer(serializers.ModelSerializer):
-    id = serializers.PrimaryKeyRelatedField(queryset=Ingredient.objects.all())
+    id = BulkPrimaryKeyRelatedField(queryset=Ingredient.objects.all())
     amount = serializers.IntegerField(min_value=1)
 
     class Meta:
         model = IngredientAmount
         fields = ("id", "amount")
+        list_serializer_class = AddRecipeIngredientsListSerializer
 
 
 class CreateRecipeSerializer(serializers.ModelSerializer):
@@ -118,7 +214,7 @@ class CreateRecipeSerializer(serializers.ModelSerializer):
     ingredients = AddRecipeIngredientsSerializer(
         many=True,
     )
-    tags = serializers.PrimaryKeyRelatedField(
+    tags = BulkPrimaryKeyRelatedField(
         many=True, queryset=Tag.objects.all())
     cooking_time = serializers.IntegerField()
     image = Base64ImageField()
@@ -143,27 +239,63 @@ class CreateRecipeSerializer(serializers.ModelSerializer):
         return cooking_time
 
     @staticmethod
-    def add_recipe_ingredients_tags(recipe, ingredients, tags):
+    def merge_amounts(ingredients):
+        amounts = {}
         for ingredient in ingredients:
-            IngredientAmount.objects.create(
-                recipe=recipe, ingredient=ingredient["id"], amount=ingredient["amount"]
-            )
-        for tag in tags:
-            recipe.tags.add(tag)
+            amounts[ingredient["id"]] = (
+                amounts.get(ingredient["id"], 0) + ingredient["amount"])
+        return amounts
 
+    @transaction.atomic
     def create(self, validated_data):
         ingredients = validated_data.pop("ingredients")
         tags = validated_data.pop("tags")
         recipe = Recipe.objects.create(
             author=self.context.get("request").user, **validated_data
         )
-        self.add_recipe_ingredients_tags(recipe, ingredients, tags)
+        IngredientAmount.objects.bulk_create(
+            IngredientAmount(
+                recipe=recipe, ingredient_id=ingredient, amount=amount)
+            for ingredient, amount in self.merge_amounts(ingredients).items()
+        )
+        recipe.tags.add(*tags)
         return recipe
 
+    def update_ingredients(self, recipe, ingredients):
+        new_amounts = self.merge_amounts(ingredients)
+        kept = {}
+        removed = []
+        for row in IngredientAmount.objects.filter(recipe=recipe):
+            if row.ingredient_id in new_amounts and row.ingredient_id not in kept:
+                kept[row.ingredient_id] = row
+            else:
+                removed.append(row.id)
+        old_amounts = {
+            ingredient: row.amount for ingredient, row in kept.items()}
+        changed = []
+        for ingredient, row in kept.items():
+            if row.amount != new_amounts[ingredient]:
+                row.amount = new_amounts[ingredient]
+                changed.append(row)
+        if removed:
+            IngredientAmount.objects.filter(id__in=removed).delete()
+        if changed:
+            IngredientAmount.objects.bulk_update(changed, ("amount",))
+        IngredientAmount.objects.bulk_create(
+            IngredientAmount(
+                recipe=recipe, ingredient_id=ingredient, amount=amount)
+            for ingredient, amount in new_amounts.items()
+            if ingredient not in kept
+        )
+        ShoppingListItem.objects.change_recipe(
+            recipe, old_amounts, new_amounts)
+
+    @transaction.atomic
     def update(self, recipe, validated_data):
-        recipe.tags.clear()
-        IngredientAmount.objects.filter(recipe=recipe).delete()
-        ingredients = validated_data.pop("ingredients")
-        tags = validated_data.pop("tags")
-        self.add_recipe_ingredients_tags(recipe, ingredients, tags)
+        ingredients = validated_data.pop("ingredients", None)
+        tags = validated_data.pop("tags", None)
+        if ingredients is not None:
+            self.update_ingredients(recipe, ingredients)
+        if tags is not None:
+            recipe.tags.set(tags)
         return super().update(recipe, validated_data)
@@ -0,0 +1,175 @@
+from functools import partial
+
+from api import images, ingredient_index, relations, search
+from api.models import (DataVersion, Favorite, Ingredient, IngredientAmount,
+                        MediaBlob, Recipe, ShopingCart, ShoppingListItem, Tag,
+                        TimelineEntry)
+from api.utils import on_commit_once
+from django.contrib.auth import get_user_model
+from django.db import transaction
+from django.db.models.signals import (post_delete, post_init, post_save,
+                                      pre_save)
+from django.dispatch import receiver
+from users.models import Follow
+
+User = get_user_model()
+
+UNKNOWN = object()
+
+COUNTERS = {
+    Favorite: "favorites_count",
+    ShopingCart: "in_carts_count",
+}
+
+VERSIONED_MODELS = (
+    Tag,
+    Ingredient,
+    Recipe,
+    IngredientAmount,
+    Favorite,
+    ShopingCart,
+    Follow,
+    User,
+)
+
+
+@receiver(post_save, sender=Ingredient)
+@receiver(post_delete, sender=Ingredient)
+def rebuild_ingredient_index(sender, **kwargs):
+    DataVersion.objects.bump_on_commit(sender)
+    on_commit_once(ingredient_index.build)
+
+
+def stored_image(instance):
+    if instance.pk is None:
+        return None
+    if "image" in instance.get_deferred_fields():
+        return UNKNOWN
+    return instance.image.name or None
+
+
+@receiver(post_init, sender=Recipe)
+def remember_image(sender, instance, **kwargs):
+    instance._stored_image = stored_image(instance)
+
+
+@receiver(post_save, sender=Recipe)
+def count_image_references(sender, instance, created, **kwargs):
+    new = stored_image(instance)
+    if new is UNKNOWN:
+        return
+    if created:
+        MediaBlob.objects.change(None, new)
+    elif instance._stored_image is not UNKNOWN:
+        MediaBlob.objects.change(instance._stored_image, new)
+    instance._stored_image = new
+
+
+@receiver(post_delete, sender=Recipe)
+def release_image(sender, instance, **kwargs):
+    name = stored_image(instance)
+    if name is not UNKNOWN:
+        MediaBlob.objects.change(name, None)
+
+
+@receiver(post_save, sender=Recipe)
+def update_search_document(sender, instance, **kwargs):
+    transaction.on_commit(partial(search.update, [instance.id]))
+
+
+@receiver(post_delete, sender=Recipe)
+def remove_search_document(sender, instance, **kwargs):
+    search.remove([instance.id])
+
+
+@receiver(post_save, sender=Ingredient)
+def update_ingredient_search_documents(sender, instance, created, **kwargs):
+    if created:
+        return
+    recipes = list(IngredientAmount.objects.filter(
+        ingredient=instance).values_list("recipe", flat=True).distinct())
+    if recipes:
+        transaction.on_commit(partial(search.update, recipes))
+
+
+@receiver(post_save, sender=Recipe)
+def schedule_image_derivatives(sender, instance, **kwargs):
+    if instance.image and not images.is_ready(instance):
+        transaction.on_commit(partial(images.schedule, instance.id))
+
+
+@receiver(post_save, sender=Recipe)
+def publish_to_timelines(sender, instance, created, **kwargs):
+    if created:
+        TimelineEntry.objects.publish(instance)
+
+
+def bump_data_version(sender, update_fields=None, **kwargs):
+    if update_fields and set(update_fields) == {"last_login"}:
+        return
+    DataVersion.objects.bump_on_commit(sender)
+
+
+for model in VERSIONED_MODELS:
+    post_save.connect(bump_data_version, sender=model)
+    post_delete.connect(bump_data_version, sender=model)
+
+
+@receiver(post_save, sender=Favorite)
+@receiver(post_save, sender=ShopingCart)
+def increment_recipe_counter(sender, instance, created, **kwargs):
+    if created:
+        Recipe.objects.change_counter(
+            [instance.recipe_id], COUNTERS[sender], 1)
+
+
+@receiver(post_delete, sender=Favorite)
+@receiver(post_delete, sender=ShopingCart)
+def decrement_recipe_counter(sender, instance, **kwargs):
+    Recipe.objects.change_counter(
+        [instance.recipe_id], COUNTERS[sender], -1)
+
+
+@receiver(post_save, sender=ShopingCart)
+def add_to_shopping_list(sender, instance, created, **kwargs):
+    if created:
+        ShoppingListItem.objects.add_recipes(
+            instance.user_id, [instance.recipe_id])
+
+
+@receiver(post_delete, sender=ShopingCart)
+def remove_from_shopping_list(sender, instance, **kwargs):
+    ShoppingListItem.objects.add_recipes(
+        instance.user_id, [instance.recipe_id], -1)
+
+
+@receiver(pre_save, sender=IngredientAmount)
+def remember_amount(sender, instance, **kwargs):
+    instance._stored_amount = None if instance.pk is None else (
+        IngredientAmount.objects.filter(pk=instance.pk)
+        .values_list("recipe", "ingredient", "amount").first())
+
+
+@receiver(post_save, sender=IngredientAmount)
+def change_shopping_list_amount(sender, instance, **kwargs):
+    amounts = [(instance.recipe_id, instance.ingredient_id, instance.amount)]
+    if instance._stored_amount is not None:
+        recipe, ingredient, amount = instance._stored_amount
+        amounts.append((recipe, ingredient, -amount))
+    ShoppingListItem.objects.change_amounts(amounts)
+
+
+@receiver(post_delete, sender=IngredientAmount)
+def remove_shopping_list_amount(sender, instance, **kwargs):
+    ShoppingListItem.objects.change_amounts(
+        [(instance.recipe_id, instance.ingredient_id, -instance.amount)])
+
+
+@receiver(post_save, sender=Favorite)
+@receiver(post_delete, sender=Favorite)
+@receiver(post_save, sender=ShopingCart)
+@receiver(post_delete, sender=ShopingCart)
+@receiver(post_save, sender=Follow)
+@receiver(post_delete, sender=Follow)
+def invalidate_relations(sender, instance, **kwargs):
+    transaction.on_commit(partial(relations.invalidate, instance.user_id))
@@ -0,0 +1,434 @@
+import base64
+import io
+import json
+import os
+import shutil
+import tempfile
+
+from api import ingredient_index
+from api.filters import CustomRecipeFilter
+from api.management.commands.projection_check import \
+    Command as ProjectionCheckCommand
+from api.management.commands.query_plans import (combinations, explain,
+                                                 filter_params,
+                                                 missing_indexes)
+from api.management.commands.toggle_stress import \
+    Command as ToggleStressCommand
+from api.models import (DataVersion, Favorite, Ingredient, IngredientAmount,
+                        Recipe, RecipeSearch, ShopingCart, ShoppingListItem,
+                        Tag, recipe_amounts)
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.core.management import call_command
+from django.db import connection
+from django.test import TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from rest_framework.renderers import JSONRenderer
+from rest_framework.test import APIClient, APIRequestFactory
+from users.models import Follow
+
+User = get_user_model()
+
+MEDIA_ROOT = tempfile.mkdtemp(prefix="foodgram-tests-")
+
+
+def tearDownModule():
+    shutil.rmtree(MEDIA_ROOT, ignore_errors=True)
+
+
+def create_recipes(count=12, users=4):
+    authors = [
+        User.objects.create_user(
+            username=f"user{i}", email=f"user{i}@foodgram.test",
+            first_name=f"First{i}", last_name=f"Last{i}", password="pass")
+        for i in range(users)
+    ]
+    Tag.objects.bulk_create(
+        Tag(name=f"Tag {i}", color=f"#{i:06X}", slug=f"tag-{i}")
+        for i in range(3)
+    )
+    tags = list(Tag.objects.order_by("id"))
+    Ingredient.objects.bulk_create(
+        Ingredient(name=f"ingredient {i}", measurement_unit="г")
+        for i in range(5)
+    )
+    ingredients = list(Ingredient.objects.order_by("id"))
+    Recipe.objects.bulk_create(
+        Recipe(
+            author=authors[i % users],
+            name=f"Recipe {i}",
+            image="media/test.png",
+            text=f"Recipe text {i}.",
+            cooking_time=i + 1,
+        )
+        for i in range(count)
+    )
+    recipes = list(Recipe.objects.order_by("id"))
+    Recipe.tags.through.objects.bulk_create(
+        Recipe.tags.through(recipe=recipe, tag=tag)
+        for index, recipe in enumerate(recipes)
+        for tag in tags[:index % len(tags) + 1]
+    )
+    IngredientAmount.objects.bulk_create(
+        IngredientAmount(recipe=recipe, ingredient=ingredient, amount=index)
+        for index, recipe in enumerate(recipes, 1)
+        for ingredient in ingredients[:index % len(ingredients) + 1]
+    )
+    Favorite.objects.bulk_create(
+        Favorite(user=authors[0], recipe=recipe) for recipe in recipes[::2])
+    Follow.objects.create(user=authors[0], following=authors[1])
+    return authors, recipes
+
+
+test_settings = override_settings(
+    MEDIA_ROOT=MEDIA_ROOT,
+    INGREDIENT_INDEX_PATH=os.path.join(MEDIA_ROOT, "ingredients.idx"),
+    CACHES={"default": {
+        "BACKEND": "django.core.cache.backends.locmem.LocMemCache",
+        "LOCATION": "foodgram-tests",
+    }},
+)
+
+
+@test_settings
+class RecipeQueryCountTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.users, cls.recipes = create_recipes(count=30)
+
+    def setUp(self):
+        cache.clear()
+        self.client = APIClient()
+        self.client.force_authenticate(self.users[0])
+
+    def assert_queries(self, queries, path, results):
+        with self.assertNumQueries(queries):
+            response = self.client.get(path)
+        self.assertEqual(response.status_code, 200)
+        if results is not None:
+            self.assertEqual(len(response.data["results"]), results)
+
+    def test_list_query_count_does_not_depend_on_page_size(self):
+        for limit in (2, 20):
+            cache.clear()
+            fields = "fields=id,tags,author,ingredients,name,is_favorited"
+            self.assert_queries(
+                8, f"/api/recipes/?limit={limit}&{fields}", limit)
+
+    def test_card_list_skips_ingredients(self):
+        for limit in (2, 20):
+            cache.clear()
+            self.assert_queries(7, f"/api/recipes/?limit={limit}", limit)
+
+    def test_detail_query_count(self):
+        self.assert_queries(
+            7, f"/api/recipes/{self.recipes[0].id}/", None)
+
+
+@test_settings
+class RecipeValidationTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.users, cls.recipes = create_recipes(count=1)
+
+    def setUp(self):
+        self.client = APIClient()
+        self.client.force_authenticate(self.users[0])
+
+    def test_related_errors_keep_per_item_shape(self):
+        ingredient = Ingredient.objects.first()
+        response = self.client.post("/api/recipes/", {
+            "tags": ["x"],
+            "ingredients": [
+                {"id": ingredient.id, "amount": 1},
+                {"id": 0, "amount": 0},
+            ],
+        }, format="json")
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.data["tags"], [
+            "Incorrect type. Expected pk value, received str."])
+        self.assertEqual(response.data["ingredients"], [{}, {
+            "id": ['Invalid pk "0" - object does not exist.'],
+            "amount": ["Ensure this value is greater than or equal to 1."],
+        }])
+
+
+def cursor(data):
+    return base64.urlsafe_b64encode(
+        json.dumps(data).encode()).decode().rstrip("=")
+
+
+@test_settings
+class CursorTests(TestCase):
+    invalid = (
+        "%%%",
+        cursor(5),
+        cursor(["-id"]),
+        cursor([["-id"], [1], False]),
+        cursor(["unknown", [1], False]),
+        cursor(["-id", 5, False]),
+        cursor(["-id", {"id": 1}, False]),
+        cursor(["-id", [], False]),
+        cursor(["-id", [1, 2], False]),
+        cursor(["-id", ["x"], False]),
+        cursor(["-id", [[1]], False]),
+        cursor(["-id", [None], False]),
+        cursor(["-id", [True], False]),
+        cursor(["-id", [1.5], False]),
+        cursor(["-id", [10 ** 30], False]),
+        cursor(["cooking_time", [1, "x"], False]),
+    )
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.users, cls.recipes = create_recipes(count=8)
+
+    def setUp(self):
+        self.client = APIClient()
+        self.client.force_authenticate(self.users[0])
+
+    def test_invalid_cursors_are_not_found(self):
+        for path in ("/api/recipes/", "/api/recipes/feed/"):
+            for value in self.invalid:
+                with self.subTest(path=path, cursor=value):
+                    response = self.client.get(path, {"cursor": value})
+                    self.assertEqual(response.status_code, 404)
+
+    def test_next_cursor_continues_the_list(self):
+        response = self.client.get(
+            "/api/recipes/", {"cursor": cursor(["-id", ["6"], False])})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(
+            [recipe["id"] for recipe in response.data["results"]],
+            [recipe.id for recipe in reversed(self.recipes[:5])])
+
+
+@test_settings
+class CountCacheTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.users, cls.recipes = create_recipes(count=8)
+        Follow.objects.bulk_create(
+            Follow(user=cls.users[2], following=author)
+            for author in (cls.users[0], cls.users[1], cls.users[3]))
+
+    def setUp(self):
+        cache.clear()
+        self.client = APIClient()
+
+    def get_count(self, user, path):
+        self.client.force_authenticate(user)
+        response = self.client.get(path)
+        self.assertEqual(response.status_code, 200)
+        return response.data["count"]
+
+    def test_subscription_count_is_per_user(self):
+        path = "/api/users/subscriptions/"
+        self.assertEqual(self.get_count(self.users[2], path), 3)
+        self.assertEqual(self.get_count(self.users[0], path), 1)
+
+    def test_recipe_count_is_shared(self):
+        self.assertEqual(self.get_count(self.users[2], "/api/recipes/"), 8)
+        with CaptureQueriesContext(connection) as queries:
+            self.assertEqual(
+                self.get_count(self.users[0], "/api/recipes/"), 8)
+        self.assertFalse(any(
+            "COUNT(" in query["sql"] for query in queries.captured_queries))
+
+
+@test_settings
+class IngredientIndexTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.users, cls.recipes = create_recipes(count=1)
+
+    def setUp(self):
+        cache.clear()
+        ingredient_index.build()
+
+    def search(self, name):
+        response = APIClient().get("/api/ingredients/", {"name": name})
+        self.assertEqual(response.status_code, 200)
+        return [ingredient["name"] for ingredient in response.data]
+
+    def test_stale_index_falls_back_to_the_database(self):
+        version, = DataVersion.objects.versions(Ingredient)
+        index = ingredient_index.IngredientIndex()
+        self.assertEqual(len(index.search("ingredient", version)), 5)
+        self.assertIsNone(index.search("ingredient", version + 1))
+        self.assertEqual(
+            os.stat(ingredient_index.settings.INGREDIENT_INDEX_PATH).st_mode
+            & 0o777, 0o644)
+
+    def test_changes_rebuild_the_index_on_commit(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            Ingredient.objects.create(
+                name="ingredient new", measurement_unit="г")
+        self.assertEqual(self.search("ingredient n"), ["ingredient new"])
+
+
+@test_settings
+class QueryPlanTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.users, cls.recipes = create_recipes(count=8)
+
+    def test_recipe_filters_use_indexes(self):
+        if connection.vendor == "postgresql":
+            with connection.cursor() as cursor:
+                cursor.execute("SET LOCAL enable_seqscan = off")
+        request = APIRequestFactory().get("/api/recipes/")
+        request.user = self.users[0]
+        params = filter_params({
+            "tag": Tag.objects.first(), "author": self.users[1]})
+        for query in combinations(params):
+            with self.subTest(query=query.urlencode()):
+                filterset = CustomRecipeFilter(
+                    query, queryset=Recipe.objects.all(), request=request)
+                self.assertTrue(filterset.is_valid())
+                plan, scans = explain(filterset.qs.order_by("-id")[:6])
+                self.assertEqual(scans, [], plan)
+                self.assertEqual(missing_indexes(query, plan), [], plan)
+
+
+@test_settings
+class RecipeSearchTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.users, cls.recipes = create_recipes(count=4)
+        Recipe.objects.filter(id=cls.recipes[0].id).update(
+            name="Борщ", text="Свекла и капуста.")
+        Recipe.objects.filter(id=cls.recipes[1].id).update(
+            name="Салат", text="Подавать с борщом.")
+        call_command("search_index", stdout=io.StringIO())
+
+    def setUp(self):
+        cache.clear()
+
+    def test_search_ranks_name_matches_first(self):
+        response = APIClient().get("/api/recipes/", {"search": "борщ"})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(
+            [recipe["id"] for recipe in response.data["results"]],
+            [self.recipes[0].id, self.recipes[1].id])
+
+    def test_search_is_not_paged_by_cursor(self):
+        response = APIClient().get(
+            "/api/recipes/", {"search": "борщ", "cursor": ""})
+        self.assertEqual(response.status_code, 400)
+        self.assertIn("cursor", response.data)
+
+    def test_deleted_recipes_leave_the_index(self):
+        Recipe.objects.filter(id=self.recipes[0].id).delete()
+        response = APIClient().get("/api/recipes/", {"search": "борщ"})
+        self.assertEqual(
+            [recipe["id"] for recipe in response.data["results"]],
+            [self.recipes[1].id])
+        self.assertFalse(RecipeSearch.objects.filter(
+            recipe=self.recipes[0].id).exists())
+
+
+@test_settings
+class RecipeCounterTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.users, cls.recipes = create_recipes(count=4)
+
+    def test_reconcile_fixes_counters_and_bumps_the_version(self):
+        Recipe.objects.filter(id=self.recipes[0].id).update(
+            favorites_count=7)
+        version, = DataVersion.objects.versions(Recipe)
+        with self.captureOnCommitCallbacks(execute=True):
+            call_command("recipe_counters", stdout=io.StringIO())
+        self.assertEqual(
+            Recipe.objects.get(id=self.recipes[0].id).favorites_count, 1)
+        self.assertEqual(DataVersion.objects.versions(Recipe), [version + 1])
+
+
+@test_settings
+class ProjectionTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.users, cls.recipes = create_recipes(count=6)
+        Follow.objects.create(user=cls.users[0], following=cls.users[2])
+
+    def test_projections_render_like_serializers(self):
+        renderer = JSONRenderer()
+        cases = ProjectionCheckCommand().cases({"user": self.users[0]})
+        for name, serialized, projected in cases:
+            with self.subTest(response=name):
+                self.assertEqual(
+                    renderer.render(projected()),
+                    renderer.render(serialized()))
+
+
+@test_settings
+class ShoppingListTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.users, cls.recipes = create_recipes(count=4)
+
+    def setUp(self):
+        self.user = self.users[2]
+        client = APIClient()
+        client.force_authenticate(self.user)
+        for recipe in self.recipes:
+            response = client.post(f"/api/recipes/{recipe.id}/shopping_cart/")
+            self.assertEqual(response.status_code, 201)
+
+    def assert_totals(self):
+        expected = recipe_amounts(*ShopingCart.objects.filter(
+            user=self.user).values_list("recipe", flat=True))
+        stored = dict(ShoppingListItem.objects.filter(
+            user=self.user).values_list("ingredient", "total_amount"))
+        self.assertEqual(stored, expected)
+
+    def test_recipe_deleted_outside_the_api(self):
+        Recipe.objects.get(id=self.recipes[0].id).delete()
+        self.assert_totals()
+        Recipe.objects.filter(id__in=[
+            recipe.id for recipe in self.recipes[1:3]]).delete()
+        self.assert_totals()
+        self.users[3].delete()
+        self.assert_totals()
+
+    def test_amounts_changed_outside_the_api(self):
+        amount = IngredientAmount.objects.filter(
+            recipe=self.recipes[1]).first()
+        amount.amount += 5
+        amount.ingredient = Ingredient.objects.last()
+        amount.save()
+        self.assert_totals()
+        IngredientAmount.objects.create(
+            recipe=self.recipes[2], ingredient=amount.ingredient, amount=3)
+        self.assert_totals()
+        IngredientAmount.objects.filter(recipe=self.recipes[3]).delete()
+        self.assert_totals()
+        ShopingCart.objects.filter(recipe=self.recipes[1]).delete()
+        self.assert_totals()
+
+
+@test_settings
+class ToggleRaceTests(TransactionTestCase):
+    def setUp(self):
+        if connection.vendor == "sqlite" and (
+                connection.creation.is_in_memory_db(
+                    connection.settings_dict["NAME"])):
+            self.skipTest("threads need a file or server test database")
+        cache.clear()
+        users, recipes = create_recipes(count=4)
+        self.context = {
+            "user": users[2],
+            "free_recipe": recipes[1],
+            "author": users[3],
+        }
+
+    def test_every_burst_has_one_winner(self):
+        command = ToggleStressCommand()
+        options = {"threads": 8, "rounds": 3}
+        for name, path, check, data in command.toggles(self.context):
+            failures = []
+            command.hammer(
+                self.context, path, check, options, failures, data)
+            with self.subTest(toggle=name):
+                self.assertEqual(failures, [])
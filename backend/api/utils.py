@@ -0,0 +1,119 @@
+from django.db import connection, transaction
+from django.http import Http404
+from rest_framework.exceptions import ValidationError
+
+
+def on_commit_once(func):
+    if connection.in_atomic_block and any(
+        callback is func for _, callback in connection.run_on_commit
+    ):
+        return
+    transaction.on_commit(func)
+
+
+def insert_unique(model, values, parent, parent_id):
+    quote = connection.ops.quote_name
+    columns = ", ".join(
+        quote(model._meta.get_field(name).column) for name in values)
+    placeholders = ", ".join(["%s"] * len(values))
+    parent_meta = parent._meta
+    sql = (
+        f"INSERT INTO {quote(model._meta.db_table)} ({columns}) "
+        f"SELECT {placeholders} WHERE EXISTS ("
+        f"SELECT 1 FROM {quote(parent_meta.db_table)} "
+        f"WHERE {quote(parent_meta.pk.column)} = %s) "
+        f"ON CONFLICT DO NOTHING RETURNING {quote(model._meta.pk.column)}"
+    )
+    with connection.cursor() as cursor:
+        cursor.execute(sql, [*values.values(), parent_id])
+        row = cursor.fetchone()
+    return row[0] if row else None
+
+
+def insert_or_add(model, rows, unique, field):
+    quote = connection.ops.quote_name
+    meta = model._meta
+    names = tuple(rows[0])
+    columns = ", ".join(quote(meta.get_field(name).column) for name in names)
+    placeholders = ", ".join(
+        ["(" + ", ".join(["%s"] * len(names)) + ")"] * len(rows))
+    conflict = ", ".join(
+        quote(meta.get_field(name).column) for name in unique)
+    table = quote(meta.db_table)
+    column = quote(meta.get_field(field).column)
+    sql = (
+        f"INSERT INTO {table} ({columns}) VALUES {placeholders} "
+        f"ON CONFLICT ({conflict}) DO UPDATE "
+        f"SET {column} = {table}.{column} + EXCLUDED.{column}"
+    )
+    with connection.cursor() as cursor:
+        cursor.execute(sql, [row[name] for row in rows for name in names])
+
+
+def insert_new(model, rows, returning):
+    quote = connection.ops.quote_name
+    meta = model._meta
+    names = tuple(rows[0])
+    columns = ", ".join(quote(meta.get_field(name).column) for name in names)
+    placeholders = ", ".join(
+        ["(" + ", ".join(["%s"] * len(names)) + ")"] * len(rows))
+    sql = (
+        f"INSERT INTO {quote(meta.db_table)} ({columns}) "
+        f"VALUES {placeholders} ON CONFLICT DO NOTHING "
+        f"RETURNING {quote(meta.get_field(returning).column)}"
+    )
+    with connection.cursor() as cursor:
+        cursor.execute(sql, [row[name] for row in rows for name in names])
+        return [row[0] for row in cursor.fetchall()]
+
+
+def delete_returning(model, values, returning):
+    quote = connection.ops.quote_name
+    meta = model._meta
+    conditions, params = [], []
+    for name, value in values.items():
+        column = quote(meta.get_field(name).column)
+        if isinstance(value, (list, tuple)):
+            conditions.append(
+                f"{column} IN ({', '.join(['%s'] * len(value))})")
+            params.extend(value)
+        else:
+            conditions.append(f"{column} = %s")
+            params.append(value)
+    sql = (
+        f"DELETE FROM {quote(meta.db_table)} "
+        f"WHERE {' AND '.join(conditions)} "
+        f"RETURNING {quote(meta.get_field(returning).column)}"
+    )
+    with connection.cursor() as cursor:
+        cursor.execute(sql, params)
+        return [row[0] for row in cursor.fetchall()]
+
+
+def parse_id(value):
+    try:
+        return int(value)
+    except (TypeError, ValueError):
+        raise Http404
+
+
+def field_names(request, param):
+    return {
+        name.strip()
+        for value in request.query_params.getlist(param)
+        for name in value.split(",")
+        if name.strip()
+    }
+
+
+def selected_fields(request, available, default):
+    fields = field_names(request, "fields")
+    omit = field_names(request, "omit")
+    unknown = (fields | omit).difference(available)
+    if unknown:
+        raise ValidationError({
+            "fields": [f"Unknown field: {name}" for name in sorted(unknown)],
+        })
+    fields = fields or set(default)
+    return tuple(
+        field for field in available if field in fields and field not in omit)
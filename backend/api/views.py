@@ -1,22 +1,46 @@
-from api.filters import CustomRecipeFilter
+from api import ingredient_index, projections
+from api.filters import (CustomRecipeFilter, RecipeOrderingFilter,
+                         RecipeSearchFilter)
+from api.mixins import ConditionalGetMixin
 from api.models import (Favorite, Ingredient, IngredientAmount, Recipe,
-                        ShopingCart, Tag)
-from api.pagination import CustomPagination
+                        ShopingCart, ShoppingListItem, Tag, TimelineEntry)
+from api.pagination import (CustomPagination, FeedPagination,
+                            RecipeKeysetPagination)
+from api.renderers import (ShoppingListCSVRenderer, ShoppingListJSONRenderer,
+                           ShoppingListTextRenderer)
 from api.serializers import (CreateRecipeSerializer, FavoriteSerializer,
                              IngredientSerializer, ListRecipeSerializer,
-                             ShoppingCartSerializer, TagSerializer)
-from django.db.models import Sum
-from django.http import HttpResponse
-from django.shortcuts import get_object_or_404
+                             RecipeIdsSerializer, ShoppingCartSerializer,
+                             ShoppingListItemSerializer, TagSerializer)
+from api.utils import parse_id, selected_fields
+from django.contrib.auth import get_user_model
+from django.db import transaction
+from django.db.models import F, Prefetch
+from django.http import Http404, StreamingHttpResponse
 from django_filters.rest_framework import DjangoFilterBackend
 from foodgram.permissions import IsAuthorOrAdminOrReadOnly
 from rest_framework import filters, status, viewsets
 from rest_framework.decorators import action
+from rest_framework.exceptions import ValidationError
 from rest_framework.permissions import AllowAny, IsAuthenticated
 from rest_framework.response import Response
+from users.models import Follow
 
+User = get_user_model()
 
-class TagViewSet(viewsets.ModelViewSet):
+RECIPE_VERSION_MODELS = (
+    Recipe,
+    IngredientAmount,
+    Ingredient,
+    Tag,
+    Favorite,
+    ShopingCart,
+    Follow,
+    User,
+)
+
+
+class TagViewSet(ConditionalGetMixin, viewsets.ModelViewSet):
     queryset = Tag.objects.all()
     permission_classes = [
         AllowAny,
@@ -25,15 +49,27 @@ class TagViewSet(viewsets.ModelViewSet):
     pagination_class = None
     filter_backends = (filters.SearchFilter,)
     search_fields = ("name",)
+    version_models = (Tag,)
 
 
-class IngredientViewSet(viewsets.ModelViewSet):
+class IngredientViewSet(ConditionalGetMixin, viewsets.ModelViewSet):
     queryset = Ingredient.objects.all()
     permission_classes = [
         IsAuthorOrAdminOrReadOnly,
     ]
     serializer_class = IngredientSerializer
     pagination_class = None
+    version_models = (Ingredient,)
+
+    def list(self, request, *args, **kwargs):
+        name = request.query_params.get("name")
+        if name:
+            ingredients = ingredient_index.index.search(
+                name, self.data_versions[Ingredient])
+            if ingredients is not None:
+                return Response(ingredients)
+        queryset = self.filter_queryset(self.get_queryset())
+        return Response(projections.ingredients(queryset))
 
     def get_queryset(self):
         queryset = Ingredient.objects.all()
@@ -43,21 +79,119 @@ class IngredientViewSet(viewsets.ModelViewSet):
         return queryset
 
 
-class RecipeViewSet(viewsets.ModelViewSet):
+class RecipeViewSet(ConditionalGetMixin, viewsets.ModelViewSet):
     queryset = Recipe.objects.all()
     permission_classes = [
         IsAuthorOrAdminOrReadOnly,
     ]
     serializer_class = CreateRecipeSerializer
     pagination_class = CustomPagination
-    filter_backends = (DjangoFilterBackend,)
+    filter_backends = (
+        DjangoFilterBackend, RecipeSearchFilter, RecipeOrderingFilter)
     filterset_class = CustomRecipeFilter
+    count_version_models = (Recipe, IngredientAmount, Ingredient, Tag,
+                            Favorite, ShopingCart)
+    shared_count = True
+    shared_count_params = ("tags", "author", "search", "ordering")
+
+    @property
+    def paginator(self):
+        if not hasattr(self, "_paginator"):
+            if self.action == "feed":
+                self._paginator = FeedPagination()
+            elif "cursor" in self.request.query_params:
+                if self.request.query_params.get("search", "").strip():
+                    raise ValidationError({"cursor": [
+                        "Search results are paged by page number."]})
+                self._paginator = RecipeKeysetPagination()
+            else:
+                self._paginator = self.pagination_class()
+        return self._paginator
+
+    def get_fields(self):
+        if self.action == "retrieve":
+            default = projections.RECIPE_FIELDS
+        else:
+            default = projections.RECIPE_CARD_FIELDS
+        return selected_fields(
+            self.request, projections.RECIPE_FIELDS, default)
+
+    def get_queryset(self):
+        if self.action in ("list", "feed"):
+            return Recipe.objects.all()
+        if self.action != "retrieve":
+            return Recipe.objects.select_related("author")
+        fields = self.get_fields()
+        queryset = Recipe.objects.only(*projections.columns(
+            projections.RECIPE_COLUMNS, fields, ("id", "author")))
+        if "author" in fields:
+            queryset = queryset.select_related("author")
+        if "tags" in fields:
+            queryset = queryset.prefetch_related("tags")
+        if "ingredients" in fields:
+            queryset = queryset.prefetch_related(Prefetch(
+                "recipe_shop",
+                queryset=IngredientAmount.objects.select_related("ingredient"),
+            ))
+        return queryset
+
+    def get_serializer_context(self):
+        context = super().get_serializer_context()
+        if self.action == "retrieve":
+            context["fields"] = self.get_fields()
+        return context
+
+    def get_version_models(self):
+        if self.action in ("list", "retrieve"):
+            return RECIPE_VERSION_MODELS
+        if self.action == "feed":
+            return RECIPE_VERSION_MODELS + (TimelineEntry,)
+        if self.action in ("shopping_list", "shoping_cart"):
+            return (ShoppingListItem, Ingredient)
+        return ()
 
     def get_serializer_class(self):
         if self.request.method == "POST" or self.request.method == "PATCH":
             return CreateRecipeSerializer
         return ListRecipeSerializer
 
+    def list(self, request, *args, **kwargs):
+        fields = self.get_fields()
+        queryset = self.filter_queryset(self.get_queryset())
+        page = self.paginate_queryset(
+            projections.recipe_rows(queryset, fields))
+        return self.get_paginated_response(
+            projections.recipes(page, request, fields))
+
+    def toggle(self, request, pk, model, serializer_class, exists_error):
+        recipe_id = parse_id(pk)
+        user = request.user
+        sign = 1 if request.method == "POST" else -1
+        with transaction.atomic():
+            if sign > 0:
+                changed = model.objects.add(user, recipe_id)
+            else:
+                changed = model.objects.remove(user, recipe_id)
+            if changed and model is ShopingCart:
+                ShoppingListItem.objects.add_recipes(
+                    user.id, [recipe_id], sign)
+        if not changed:
+            if not Recipe.objects.filter(id=recipe_id).exists():
+                raise Http404
+            if sign > 0:
+                return Response(
+                    {"error": exists_error},
+                    status=status.HTTP_400_BAD_REQUEST,
+                )
+            return Response(status=status.HTTP_400_BAD_REQUEST)
+        if sign < 0:
+            return Response(status=status.HTTP_204_NO_CONTENT)
+        serializer = serializer_class(
+            model(id=changed, user=user, recipe_id=recipe_id),
+            context={"request": request},
+        )
+        return Response(serializer.data, status=status.HTTP_201_CREATED)
+
     @action(
         detail=True,
         methods=["POST", "DELETE"],
@@ -65,27 +199,9 @@ class RecipeViewSet(viewsets.ModelViewSet):
         permission_classes=[IsAuthenticated],
     )
     def shopping_cart(self, request, pk=None):
-        user = request.user
-        recipe = get_object_or_404(Recipe, id=pk)
-        if request.method == "POST":
-            if ShopingCart.objects.filter(user=user, recipe=recipe).exists():
-                return Response(
-                    {"error": "Этот рецепт уже добавлен в корзину"},
-                    status=status.HTTP_400_BAD_REQUEST,
-                )
-            shoping_cart = ShopingCart.objects.create(user=user, recipe=recipe)
-            serializer = ShoppingCartSerializer(
-                shoping_cart, context={"request": request}
-            )
-            return Response(serializer.data, status=status.HTTP_201_CREATED)
-
-        if request.method == "DELETE":
-            delete_shoping_cart = ShopingCart.objects.filter(
-                user=user, recipe=recipe)
-            if delete_shoping_cart.exists():
-                delete_shoping_cart.delete()
-                return Response(status=status.HTTP_204_NO_CONTENT)
-            return Response(status=status.HTTP_400_BAD_REQUEST)
+        return self.toggle(
+            request, pk, ShopingCart, ShoppingCartSerializer,
+            "Этот рецепт уже добавлен в корзину")
 
     @action(
         detail=True,
@@ -94,56 +210,115 @@ class RecipeViewSet(viewsets.ModelViewSet):
         permission_classes=[IsAuthenticated],
     )
     def favorite(self, request, pk=None):
+        return self.toggle(
+            request, pk, Favorite, FavoriteSerializer,
+            "Етот рецепт уже добавлин в избранное")
+
+    def change_many(self, request, model):
+        serializer = RecipeIdsSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        ids = serializer.validated_data["recipes"]
+        found = set(Recipe.objects.filter(id__in=ids).values_list(
+            "id", flat=True))
+        recipes = [recipe for recipe in ids if recipe in found]
         user = request.user
-        recipe = get_object_or_404(Recipe, id=pk)
-        if request.method == "POST":
-            if Favorite.objects.filter(user=user, recipe=recipe).exists():
-                return Response(
-                    {"error": "Етот рецепт уже добавлин в избранное"},
-                    status=status.HTTP_400_BAD_REQUEST,
-                )
-            favorite = Favorite.objects.create(user=user, recipe=recipe)
-            serializer = FavoriteSerializer(
-                favorite, context={"request": request})
-            return Response(serializer.data, status=status.HTTP_201_CREATED)
-
-        if request.method == "DELETE":
-            favorite = Favorite.objects.filter(user=user, recipe=recipe)
-            if favorite.exists():
-                favorite.delete()
-                return Response(status=status.HTTP_204_NO_CONTENT)
-            return Response(status=status.HTTP_400_BAD_REQUEST)
+        with transaction.atomic():
+            if request.method == "POST":
+                changed = model.objects.add_many(user, recipes)
+                statuses = ("added", "already_added")
+            else:
+                changed = model.objects.remove_many(user, recipes)
+                statuses = ("removed", "not_added")
+            if model is ShopingCart and changed:
+                ShoppingListItem.objects.add_recipes(
+                    user.id, changed, 1 if request.method == "POST" else -1)
+        changed = set(changed)
+        results = [
+            {
+                "id": recipe,
+                "status": "not_found" if recipe not in found else (
+                    statuses[0] if recipe in changed else statuses[1]),
+            }
+            for recipe in ids
+        ]
+        return Response({"results": results})
+
+    @action(
+        detail=False,
+        methods=["POST", "DELETE"],
+        url_path="shopping_cart",
+        url_name="shopping-cart-many",
+        permission_classes=[IsAuthenticated],
+    )
+    def shopping_cart_many(self, request):
+        return self.change_many(request, ShopingCart)
+
+    @action(
+        detail=False,
+        methods=["POST", "DELETE"],
+        url_path="favorite",
+        url_name="favorite-many",
+        permission_classes=[IsAuthenticated],
+    )
+    def favorite_many(self, request):
+        return self.change_many(request, Favorite)
+
+    @action(
+        detail=False,
+        methods=["GET"],
+        url_path="feed",
+        permission_classes=[IsAuthenticated],
+    )
+    def feed(self, request):
+        fields = self.get_fields()
+        page = self.paginate_queryset(
+            projections.recipe_rows(self.get_queryset(), fields))
+        return self.get_paginated_response(
+            projections.recipes(page, request, fields))
 
     @action(
         detail=False,
         methods=["GET"],
         url_path="download_shopping_cart",
         permission_classes=[IsAuthenticated],
+        renderer_classes=[
+            ShoppingListTextRenderer,
+            ShoppingListCSVRenderer,
+            ShoppingListJSONRenderer,
+        ],
     )
     def shoping_cart(self, request):
-        all_count_ingredients = (
-            IngredientAmount.objects.filter(
-                recipe__recipe_cart__user=request.user)
-            .values("ingredient__name", "ingredient__measurement_unit")
-            .annotate(amount=Sum("amount"))
-        )
-        shop_list = {}
-        for ingredient in all_count_ingredients:
-            amount = ingredient["amount"]
-            name = ingredient["ingredient__name"]
-            measurement_unit = ingredient["ingredient__measurement_unit"]
-            shop_list[name] = {
-                "amount": amount,
-                "measurement_unit": measurement_unit}
-        out_list = ["Ingredient list\n\n"]
-        for ingr, value in shop_list.items():
-            out_list.append(
-                f" {ingr} - {value['amount']} " f"{value['measurement_unit']}\n"
+        ingredients = (
+            ShoppingListItem.objects.filter(user=request.user)
+            .values(
+                name=F("ingredient__name"),
+                measurement_unit=F("ingredient__measurement_unit"),
+                amount=F("total_amount"),
             )
-        return HttpResponse(
-            out_list,
-            {
-                "Content-Type": "text/plain",
-                "Content-Disposition": 'attachment; filename="out_list.txt"',
+            .order_by("name", "measurement_unit")
+            .iterator()
+        )
+        renderer = request.accepted_renderer
+        return StreamingHttpResponse(
+            renderer.stream(ingredients),
+            content_type=f"{renderer.media_type}; charset=utf-8",
+            headers={
+                "Content-Disposition": (
+                    f'attachment; filename="out_list.{renderer.format}"'),
             },
         )
+
+    @action(
+        detail=False,
+        methods=["GET"],
+        url_path="shopping_list",
+        permission_classes=[IsAuthenticated],
+    )
+    def shopping_list(self, request):
+        items = (
+            ShoppingListItem.objects.filter(user=request.user)
+            .select_related("ingredient")
+            .order_by("ingredient__name", "ingredient__measurement_unit")
+        )
+        serializer = ShoppingListItemSerializer(items, many=True)
+        return Response(serializer.data)
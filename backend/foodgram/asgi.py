@@ -8,9 +8,49 @@ https://docs.djangoproject.com/en/3.2/howto/deployment/asgi/
 """
 
 import os
+from itertools import islice
 
-from django.core.asgi import get_asgi_application
+import django
+from asgiref.sync import ThreadSensitiveContext, sync_to_async
+from django.core.handlers.asgi import ASGIHandler
 
 os.environ.setdefault("DJANGO_SETTINGS_MODULE", "foodgram.settings")
 
-application = get_asgi_application()
+STREAM_PARTS = 256
+
+
+def next_parts(iterator):
+    return list(islice(iterator, STREAM_PARTS))
+
+
+class FoodgramASGIHandler(ASGIHandler):
+    async def __call__(self, scope, receive, send):
+        async with ThreadSensitiveContext():
+            await super().__call__(scope, receive, send)
+
+    async def send_response(self, response, send):
+        if not response.streaming:
+            await super().send_response(response, send)
+            return
+        iterator = iter(response)
+        response.streaming_content = ()
+
+        async def send_streaming(message):
+            if message == {"type": "http.response.body"}:
+                while True:
+                    parts = await sync_to_async(
+                        next_parts, thread_sensitive=True)(iterator)
+                    if not parts:
+                        break
+                    await send({
+                        "type": "http.response.body",
+                        "body": b"".join(parts),
+                        "more_body": True,
+                    })
+            await send(message)
+
+        await super().send_response(response, send_streaming)
+
+
+django.setup(set_prefix=False)
+application = FoodgramASGIHandler()
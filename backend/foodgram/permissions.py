@@ -3,6 +3,6 @@ from rest_framework.permissions import SAFE_METHODS, BasePermission
 
 class IsAuthorOrAdminOrReadOnly(BasePermission):
     def has_object_permission(self, request, view, obj):
-        if request.user.is_superuser or obj.author == request.user:
+        if request.user.is_superuser or obj.author_id == request.user.id:
             return True
         return request.method in SAFE_METHODS
@@ -69,6 +69,7 @@ DATABASES = {
         "PASSWORD": os.environ.get("POSTGRES_PASSWORD", default="postgres"),
         "HOST": os.environ.get("DB_HOST", default="db"),
         "PORT": os.environ.get("DB_PORT", default="5432"),
+        "TEST": {"NAME": os.environ.get("DB_TEST_NAME")},
     }
 }
 
@@ -87,7 +88,18 @@ STATIC_URL = "/static/"
 
 DEFAULT_AUTO_FIELD = "django.db.models.BigAutoField"
 
+FAST_JSON = os.environ.get("FAST_JSON", default="True") == "True"
+
 REST_FRAMEWORK = {
+    "DEFAULT_RENDERER_CLASSES": (
+        "api.renderers.FastJSONRenderer" if FAST_JSON else "rest_framework.renderers.JSONRenderer",
+        "rest_framework.renderers.BrowsableAPIRenderer",
+    ),
+    "DEFAULT_PARSER_CLASSES": (
+        "api.parsers.FastJSONParser" if FAST_JSON else "rest_framework.parsers.JSONParser",
+        "rest_framework.parsers.FormParser",
+        "rest_framework.parsers.MultiPartParser",
+    ),
     "DEFAULT_AUTHENTICATION_CLASSES": (
         "rest_framework.authentication.TokenAuthentication",
     ),
@@ -120,5 +132,25 @@ DJOSER = {
 STATIC_URL = "/static_files/"
 STATIC_ROOT = os.path.join(BASE_DIR, "static_files")
 
+CACHES = {
+    "default": {
+        "BACKEND": os.environ.get("CACHE_BACKEND", default="django.core.cache.backends.locmem.LocMemCache"),
+        "LOCATION": os.environ.get("CACHE_LOCATION", default="foodgram"),
+    }
+}
+
+RELATIONS_CACHE = "default"
+RELATIONS_CACHE_TIMEOUT = int(os.environ.get("RELATIONS_CACHE_TIMEOUT", default=300))
+
+FEED_FANOUT_LIMIT = 10000
+FEED_BATCH_SIZE = 1000
+FEED_BACKFILL_LIMIT = 200
+
+SEARCH_CONFIG = os.environ.get("SEARCH_CONFIG", default="russian")
+
+IMAGE_DERIVATIVE_WORKERS = int(os.environ.get("IMAGE_DERIVATIVE_WORKERS", default=2))
+
+INGREDIENT_INDEX_PATH = os.path.join(BASE_DIR, "data", "ingredients.idx")
+
 MEDIA_URL = "/media/"
-MEDIA_ROOT = os.path.join(BASE_DIR, "media")
+MEDIA_ROOT = os.environ.get("MEDIA_ROOT", default=os.path.join(BASE_DIR, "media"))
@@ -0,0 +1,9 @@
+import os
+
+bind = "0:8000"
+
+if os.environ.get("SERVER_MODE", default="wsgi") == "asgi":
+    wsgi_app = "foodgram.asgi:application"
+    worker_class = "uvicorn.workers.UvicornWorker"
+else:
+    wsgi_app = "foodgram.wsgi:application"
@@ -1,10 +1,24 @@
+from api.admin import ScalableAdmin
 from django.contrib import admin
+from django.contrib.auth import get_user_model
+from django.contrib.auth.admin import UserAdmin
 from users.models import Follow
 
+User = get_user_model()
+
 
 @admin.register(Follow)
-class FollowAdmin(admin.ModelAdmin):
+class FollowAdmin(ScalableAdmin):
     list_display = ("user", "following")
-    search_fields = ("user", "following")
-    list_filter = ("id", "user")
+    list_select_related = ("user", "following")
+    search_fields = ("=user__username", "=following__username")
+    raw_id_fields = ("user", "following")
     empty_value_display = "-NONE-"
+
+
+admin.site.unregister(User)
+
+
+@admin.register(User)
+class ScalableUserAdmin(ScalableAdmin, UserAdmin):
+    search_fields = ("=username", "=email")
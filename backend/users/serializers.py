@@ -1,9 +1,10 @@
+from api.images import derivative_urls
 from api.models import Recipe
+from api.relations import get_relations
 from django.contrib.auth import get_user_model
 from djoser.serializers import UserCreateSerializer, UserSerializer
 from rest_framework import serializers
 from rest_framework.validators import UniqueValidator
-from users.models import Follow
 
 User = get_user_model()
 
@@ -48,20 +49,23 @@ class CustomUserSerializer(UserSerializer):
         model = User
 
     def get_is_subscribed(self, obj):
-        user = self.context.get("request").user
-        if user.is_anonymous:
-            return False
-        return Follow.objects.filter(user=user, following=obj).exists()
+        relations = get_relations(self.context.get("request"))
+        return obj.id in relations.following
 
 
 class RecipeForFollowSerializer(serializers.ModelSerializer):
+    images = serializers.SerializerMethodField()
+
     class Meta:
         model = Recipe
-        fields = ("id", "name", "image", "cooking_time")
+        fields = ("id", "name", "image", "images", "cooking_time")
+
+    def get_images(self, obj):
+        return derivative_urls(obj, self.context.get("request"))
 
 
 class ListFollowSerializer(serializers.ModelSerializer):
-    email = serializers.ReadOnlyField(source="user.email")
+    email = serializers.ReadOnlyField(source="following.email")
     id = serializers.ReadOnlyField(source="following.id")
     username = serializers.ReadOnlyField(source="following.username")
     first_name = serializers.ReadOnlyField(source="following.first_name")
@@ -85,14 +89,20 @@ class ListFollowSerializer(serializers.ModelSerializer):
 
     def get_is_subscribed(self, obj):
         user = self.context.get("request").user
-        if user.is_anonymous:
-            return False
-        return Follow.objects.filter(user=user, following=obj.id).exists()
+        if obj.user_id == user.id:
+            return True
+        relations = get_relations(self.context.get("request"))
+        return obj.following_id in relations.following
 
     def get_recipes(self, obj):
-        recipes = Recipe.objects.filter(author=obj.following)
+        if hasattr(obj.following, "subscription_recipes"):
+            recipes = obj.following.subscription_recipes
+        else:
+            recipes = Recipe.objects.filter(author=obj.following_id)
         serializer = RecipeForFollowSerializer(recipes, many=True)
         return serializer.data
 
     def get_recipes_count(self, obj):
-        return Recipe.objects.filter(author=obj.id).count()
+        if hasattr(obj, "recipes_count"):
+            return obj.recipes_count
+        return Recipe.objects.filter(author=obj.following_id).count()
@@ -1,5 +1,16 @@
+from functools import partial
+
+from api import projections, relations
+from api.mixins import ConditionalGetMixin
+from api.models import DataVersion, Recipe, TimelineEntry
 from api.pagination import CustomPagination
+from api.utils import (delete_returning, insert_unique, parse_id,
+                       selected_fields)
 from django.contrib.auth import get_user_model
+from django.db import transaction
+from django.db.models import Count, F, OuterRef, Prefetch, Subquery, Window
+from django.db.models.expressions import RawSQL
+from django.db.models.functions import Coalesce, RowNumber
 from rest_framework import permissions, status
 from rest_framework.generics import ListAPIView, get_object_or_404
 from rest_framework.response import Response
@@ -10,41 +21,134 @@ from users.serializers import ListFollowSerializer
 User = get_user_model()
 
 
+def get_recipes_limit(request):
+    try:
+        recipes_limit = int(request.query_params.get("recipes_limit"))
+    except (TypeError, ValueError):
+        return None
+    return max(recipes_limit, 0)
+
+
+def latest_recipes(authors, limit):
+    ranked = (
+        Recipe.objects.filter(author__in=authors)
+        .annotate(place=Window(
+            RowNumber(), partition_by=F("author"), order_by=F("id").desc()))
+        .order_by()
+        .values("id", "place")
+    )
+    sql, params = ranked.query.sql_with_params()
+    return RawSQL(
+        f"SELECT id FROM ({sql}) ranked WHERE place <= %s",
+        (*params, limit))
+
+
+def subscription_recipes(request, authors):
+    recipes = Recipe.objects.only(
+        "id", "author", "name", "image", "image_derivatives", "cooking_time"
+    ).filter(author__in=authors)
+    recipes_limit = get_recipes_limit(request)
+    if recipes_limit is not None:
+        recipes = recipes.filter(
+            id__in=latest_recipes(authors, recipes_limit))
+    return recipes.order_by("-id")
+
+
+def subscriptions(request, counted=True):
+    follows = Follow.objects.filter(user=request.user)
+    if not counted:
+        return follows
+    recipes_count = (
+        Recipe.objects.filter(author=OuterRef("following"))
+        .order_by()
+        .values("author")
+        .annotate(count=Count("id"))
+        .values("count")
+    )
+    return follows.annotate(
+        recipes_count=Coalesce(Subquery(recipes_count), 0))
+
+
+def get_subscriptions(request):
+    return (
+        subscriptions(request)
+        .select_related("following")
+        .prefetch_related(Prefetch(
+            "following__author_resipe",
+            queryset=subscription_recipes(
+                request, subscriptions(request, False).values("following")),
+            to_attr="subscription_recipes",
+        ))
+    )
+
+
+def follows_changed(user):
+    DataVersion.objects.bump_on_commit(Follow)
+    transaction.on_commit(partial(relations.invalidate, user.id))
+
+
 class FollowApiView(APIView):
     def post(self, request, pk):
         user = request.user
-        following = get_object_or_404(User, id=pk)
-        if user == following:
+        following_id = parse_id(pk)
+        if following_id == user.id:
             return Response(
                 {"error": "Нельзя подписаться на самого себя"},
                 status=status.HTTP_400_BAD_REQUEST,
             )
-        if Follow.objects.filter(user=user, following=following).exists():
+        with transaction.atomic():
+            follow_id = insert_unique(
+                Follow, {"user": user.id, "following": following_id},
+                User, following_id)
+            if follow_id is not None:
+                follows_changed(user)
+                TimelineEntry.objects.backfill(user, following_id)
+        if follow_id is None:
+            get_object_or_404(User, id=following_id)
             return Response(
                 {"error": "Вы уже подписаны на данного автора"},
                 status=status.HTTP_400_BAD_REQUEST,
             )
-        create_follow = Follow.objects.create(user=user, following=following)
         serializer = ListFollowSerializer(
-            create_follow, context={"request": request})
+            get_subscriptions(request).get(id=follow_id),
+            context={"request": request},
+        )
         return Response(serializer.data, status=status.HTTP_201_CREATED)
 
     def delete(self, request, pk):
         user = request.user
-        following = get_object_or_404(User, id=pk)
-        delete_follow = Follow.objects.filter(user=user, following=following)
-        if delete_follow.exists():
-            delete_follow.delete()
+        following_id = parse_id(pk)
+        with transaction.atomic():
+            removed = delete_returning(
+                Follow, {"user": user.id, "following": following_id}, "id")
+            if removed:
+                follows_changed(user)
+                TimelineEntry.objects.trim(user, following_id)
+        if removed:
             return Response(status=status.HTTP_204_NO_CONTENT)
+        get_object_or_404(User, id=following_id)
         return Response(status=status.HTTP_400_BAD_REQUEST)
 
 
-class FollowListViewSet(ListAPIView):
+class FollowListViewSet(ConditionalGetMixin, ListAPIView):
     queryset = Follow.objects.all()
     permission_classes = [permissions.IsAuthenticated, ]
     serializer_class = ListFollowSerializer
     pagination_class = CustomPagination
+    version_models = (Follow, Recipe, User)
+    count_version_models = (Follow,)
+
+    def get_fields(self):
+        return selected_fields(
+            self.request, projections.FOLLOW_FIELDS, projections.FOLLOW_FIELDS)
 
     def get_queryset(self):
-        user = self.request.user
-        return Follow.objects.filter(user=user)
+        return subscriptions(
+            self.request, "recipes_count" in self.get_fields())
+
+    def list(self, request, *args, **kwargs):
+        fields = self.get_fields()
+        page = self.paginate_queryset(
+            projections.follow_rows(self.get_queryset(), fields))
+        return self.get_paginated_response(projections.follows(
+            page, partial(subscription_recipes, request), request, fields))